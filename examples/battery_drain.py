@@ -1,13 +1,13 @@
 """Example using the m1k library to perform Jsc tracking on all channels."""
 
-import csv
 import pathlib
 import time
 import sys
 
 import matplotlib.pyplot as plt
+import numpy as np
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.joinpath("src")))
+sys.path.insert(1, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("src")))
 import m1k.m1k as m1k
 
 data_folder = pathlib.Path("data")
@@ -26,30 +26,42 @@ def steady_state_v(smu, v=0, delay=0.5, t_end=30):
 
     Returns
     -------
-    data : list of tuples
-        Steady-state Voc data.
+    data : dict of numpy.ndarray
+        Steady-state data for each channel with rows of (voltage, current, time,
+        status).
     """
-    # init container
+    # preallocate containers for the most points that can fit in the measurement
+    # time
+    max_points = int(t_end // delay) + 1
     num_channels = smu.num_channels
-    i_data = {}
-    for ch in range(num_channels):
-        i_data[ch] = []
+    i_data = {ch: np.empty((max_points, 4)) for ch in range(num_channels)}
+
+    # set the output once, it doesn't change during the measurement
+    smu.configure_dc(v, source_mode="v")
+
+    # tab-separated row of voltage, current, time, and status
+    row_fmt = "{:.6e}\t{:.6e}\t{:.6f}\t{}\n".format
 
     # run steady-state measurement
     with open(save_file, "w", newline="\n") as f:
-        writer = csv.writer(f, delimiter="\t")
-        t_start = time.time()
-        while time.time() - t_start < t_end:
-            smu.configure_dc(v, source_mode="v")
+        t_start = time.monotonic()
+        point = 0
+        while (time.monotonic() - t_start < t_end) and (point < max_points):
             point_data = smu.measure(measurement="dc")
             for ch, ch_data in point_data.items():
-                i_data[ch].extend(ch_data)
-            writer.writerow(point_data[0])
+                i_data[ch][point] = ch_data[0]
+            point += 1
+            f.write(row_fmt(*point_data[0][0]))
             print(point_data[0])
 
-            time.sleep(delay)
+            # wait until the next point is due so the sample times don't drift
+            time.sleep(max(0, t_start + point * delay - time.monotonic()))
+
+    # trim unused rows
+    for ch in range(num_channels):
+        i_data[ch] = i_data[ch][:point]
 
-    return jsc_data
+    return i_data
 
 
 with m1k.smu() as smu:
@@ -81,14 +93,18 @@ fig, ax = plt.subplots()
 
 max_jscs = []
 for ch, ch_data in jsc_data.items():
-    currents = []
-    times = []
-    t0 = ch_data[0][2]
-    for v, i, t, s in ch_data:
-        currents.append(abs(i) * 1000)
-        times.append(t - t0)
-    ax.scatter(times, currents, label=f"channel {ch}")
-    max_jscs.append(max(currents))
+    ch_data = np.asarray(ch_data, dtype=float)
+    currents = np.absolute(ch_data[:, 1]) * 1000
+    times = ch_data[:, 2] - ch_data[0, 2]
+    ax.plot(
+        times,
+        currents,
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"channel {ch}",
+    )
+    max_jscs.append(currents.max())
 
 ax.tick_params(direction="in", top=True, right=True, labelsize="large")
 ax.set_xlabel("Time (s)", fontsize="large")
@@ -1,5 +1,6 @@
 """Compare devices measurements from Keithley 2400 with a calibrated M1K."""
 
+import atexit
 import pathlib
 import time
 import sys
@@ -9,22 +10,30 @@ import numpy as np
 import pyvisa
 import yaml
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.parent.joinpath("src")))
+sys.path.insert(
+    1, str(pathlib.Path(__file__).resolve().parent.parent.parent.joinpath("src"))
+)
 import m1k.m1k as m1k
+from m1k.yaml_utils import SafeLoader, SafeDumper
 
 
 cwd = pathlib.Path.cwd()
 cal_data_folder = cwd.joinpath("data")
-save_file = cal_data_folder.joinpath(f"k_vs_m_{time.time()}.yaml")
+t = time.time()
+save_file = cal_data_folder.joinpath(f"k_vs_m_{t}.npz")
+metadata_file = cal_data_folder.joinpath(f"k_vs_m_{t}.yaml")
 
 # connect to keithley 2400
 print("\nConnecting to Keithley 2400...")
 address = "ASRL3::INSTR"
-baud = 19200
+# fastest rs-232 rate the keithley supports, must match its front panel setting
+baud = 57600
 flow_control = 1
 term_char = "\n"
 
 rm = pyvisa.ResourceManager()
+# closing the resource manager also closes any sessions it opened
+atexit.register(rm.close)
 
 keithley2400 = rm.open_resource(
     address,
@@ -32,6 +41,7 @@ keithley2400 = rm.open_resource(
     flow_control=flow_control,
     write_termination=term_char,
     read_termination=term_char,
+    timeout=10000,  # in ms, long enough to read back a full list sweep
 )
 print(f"Keithley ID: {keithley2400.query('*IDN?')}")
 print("Connected!")
@@ -48,7 +58,7 @@ ext_cal_file = cal_data_folder.joinpath(
     "cal_1617792611_2032205054325238313130333030323_v2.yaml"
 )
 with open(ext_cal_file, "r") as f:
-    ext_cal = yaml.load(f, Loader=yaml.FullLoader)
+    ext_cal = yaml.load(f, Loader=SafeLoader)
 ext_cal = ext_cal["2032205054325238313130333030323"]
 smu.use_external_calibration(0, ext_cal)
 
@@ -74,36 +84,58 @@ ss_points = 10
 
 # setup keithley
 print("\nConfiguring Keithley 2400...")
-# reset
-keithley2400.write("*RST")
-# Disable the output
-keithley2400.write(":OUTP OFF")
-# Disable beeper
-keithley2400.write(":SYST:BEEP:STAT OFF")
-# Set front terminals
-keithley2400.write(":ROUT:TERM FRONT")
-# Enable 4-wire sense
-keithley2400.write(":SYST:RSEN 1")
-# Don't auto-off source after measurement
-keithley2400.write(":SOUR:CLE:AUTO OFF")
-# Set output-off mode to high impedance
-keithley2400.write(":OUTP:SMOD HIMP")
-# Make sure output never goes above 20 V
-keithley2400.write(":SOUR:VOLT:PROT 20")
-# Enable and set concurrent measurements
-keithley2400.write(":SENS:FUNC:CONC ON")
-keithley2400.write(':SENS:FUNC "CURR", "VOLT"')
-# Set read format
-keithley2400.write(":FORM:ELEM TIME,VOLT,CURR,STAT")
-# Set the integration filter (applies globally for all measurement types)
-keithley2400.write(f":SENS:CURR:NPLC {nplc}")
-# Set the delay
-keithley2400.write(f":SOUR:DEL {settling_delay}")
-# Disable autozero
-keithley2400.write(":SYST:AZER OFF")
+# reset, disable the output and beeper, set front terminals, enable 4-wire sense,
+# don't auto-off source after measurement, set output-off mode to high impedance,
+# and make sure output never goes above 20 V
+keithley2400.write(
+    "*RST;:OUTP OFF;:SYST:BEEP:STAT OFF;:ROUT:TERM FRONT;:SYST:RSEN 1;"
+    + ":SOUR:CLE:AUTO OFF;:OUTP:SMOD HIMP;:SOUR:VOLT:PROT 20"
+)
+# enable and set concurrent measurements, set read format (binary formats aren't
+# available over RS-232 so make sure it's ASCII), set the integration filter
+# (applies globally for all measurement types), set the delay, and disable
+# autozero
+keithley2400.write(
+    ':SENS:FUNC:CONC ON;:SENS:FUNC "CURR", "VOLT";:FORM:DATA ASC;'
+    + ":FORM:ELEM TIME,VOLT,CURR,STAT;"
+    + f":SENS:CURR:NPLC {nplc};:SOUR:DEL {settling_delay};:SYST:AZER OFF"
+)
 print("Keithley configuration complete!")
 
 
+def keithley_read_points(points, delay=0):
+    """Trigger and read a number of points from the Keithley 2400 in one transaction.
+
+    The Keithley times the points itself using its trigger delay.
+
+    Parameters
+    ----------
+    points : int
+        Number of points to measure.
+    delay : float
+        Delay in seconds before each point.
+
+    Returns
+    -------
+    data : list of list
+        Measurement rows of (voltage, current, time, status).
+    """
+    keithley2400.write(f":TRIG:DEL {delay};:TRIG:COUN {points}")
+
+    # allow for the delays when waiting for the response
+    timeout = keithley2400.timeout
+    keithley2400.timeout = timeout + 1000 * delay * points
+    try:
+        flat_data = keithley2400.query_ascii_values(":READ?")
+    finally:
+        # restore the timeout and single point triggering even if the read fails
+        keithley2400.timeout = timeout
+        keithley2400.write(":TRIG:DEL 0;:TRIG:COUN 1")
+
+    # split readings into rows
+    return [flat_data[i : i + 4] for i in range(0, len(flat_data), 4)]
+
+
 def m1k_sweep(start, stop, points):
     """Perform voltage sweep using ADALM1000."""
     print("\nPerforming m1k voltage sweep measurement...")
@@ -133,24 +165,22 @@ def keithley_sweep(start, stop, points):
     sweep_voltages = np.linspace(start, stop, points)
 
     # Autorange keithley source votlage and measure current
-    keithley2400.write(":SOUR:FUNC VOLT")
-    keithley2400.write(":SENS:FUNC 'CURR'")
-    keithley2400.write(":SOUR:VOLT:RANG:AUTO ON")
-    keithley2400.write(":SENS:CURR:RANG:AUTO ON")
+    keithley2400.write(
+        ":SOUR:FUNC VOLT;:SENS:FUNC 'CURR';:SOUR:VOLT:RANG:AUTO ON;"
+        + ":SENS:CURR:RANG:AUTO ON"
+    )
 
     # set keithley to source zero volts and enable output
-    keithley2400.write(":SOUR:VOLT 0")
-    keithley2400.write(":OUTP ON")
-    keithley2400.write(":SYST:AZER ONCE")
+    keithley2400.write(":SOUR:VOLT 0;:OUTP ON")
 
-    data = []
-    for v in sweep_voltages:
-        keithley2400.write(f":SOUR:VOLT {v}")
-        data.append(keithley2400.query_ascii_values(":READ?"))
+    # program the sweep as a source list so all points are measured with a single
+    # read instead of a write and read per point
+    source_list = ",".join(f"{v:.6f}" for v in sweep_voltages)
+    keithley2400.write(f":SOUR:VOLT:MODE LIST;:SOUR:LIST:VOLT {source_list}")
+    data = keithley_read_points(points)
 
-    # turn off smu outputs
-    keithley2400.write(":SOUR:VOLT 0")
-    keithley2400.write(":OUTP OFF")
+    # return to fixed sourcing and turn off smu outputs
+    keithley2400.write(":SOUR:VOLT:MODE FIX;:SOUR:VOLT 0;:OUTP OFF")
 
     print("Keithley voltage sweep complete!")
 
@@ -161,11 +191,9 @@ def m1k_voc(delay, points):
     """Perform Voc measurement using m1k."""
     print("\nPerforming m1k Voc measurement...")
 
-    # init container
+    # preallocate containers with a row of (voltage, current, time, status) per point
     num_channels = smu.num_channels
-    voc_data = {}
-    for ch in range(num_channels):
-        voc_data[ch] = []
+    voc_data = {ch: np.empty((points, 4)) for ch in range(num_channels)}
 
     # set ouptut in HI_Z mode
     smu.enable_output(False)
@@ -174,7 +202,7 @@ def m1k_voc(delay, points):
     for point in range(points):
         point_data = smu.measure(measurement="dc")
         for ch, ch_data in point_data.items():
-            voc_data[ch].extend(ch_data)
+            voc_data[ch][point] = ch_data[0]
 
         time.sleep(delay)
 
@@ -188,21 +216,16 @@ def keithley_voc(delay, points):
     print("\nPerforming keithley voc measurement...")
 
     # Autorange keithley source votlage and measure current
-    keithley2400.write(":SOUR:FUNC CURR")
-    keithley2400.write(":SENS:FUNC 'VOLT'")
-    keithley2400.write(":SOUR:CURR:RANG:AUTO ON")
-    keithley2400.write(":SENS:VOLT:RANG:AUTO ON")
+    keithley2400.write(
+        ":SOUR:FUNC CURR;:SENS:FUNC 'VOLT';:SOUR:CURR:RANG:AUTO ON;"
+        + ":SENS:VOLT:RANG:AUTO ON"
+    )
 
     # set keithley to source zero volts and enable output
-    keithley2400.write(":SOUR:CURR 0")
-    keithley2400.write(":OUTP ON")
-    keithley2400.write(":SYST:AZER ONCE")
+    keithley2400.write(":SOUR:CURR 0;:OUTP ON")
 
     # run steady-state voc
-    data = []
-    for point in range(points):
-        data.append(keithley2400.query_ascii_values(":READ?"))
-        time.sleep(delay)
+    data = keithley_read_points(points, delay)
 
     keithley2400.write(":OUTP OFF")
 
@@ -215,11 +238,9 @@ def m1k_jsc(delay, points):
     """Perform jsc measurement using m1k."""
     print("\nPerforming m1k jsc measurement...")
 
-    # init container
+    # preallocate containers with a row of (voltage, current, time, status) per point
     num_channels = smu.num_channels
-    jsc_data = {}
-    for ch in range(num_channels):
-        jsc_data[ch] = []
+    jsc_data = {ch: np.empty((points, 4)) for ch in range(num_channels)}
 
     # configure output
     smu.configure_dc(0, source_mode="v")
@@ -229,7 +250,7 @@ def m1k_jsc(delay, points):
     for point in range(points):
         point_data = smu.measure(measurement="dc")
         for ch, ch_data in point_data.items():
-            jsc_data[ch].extend(ch_data)
+            jsc_data[ch][point] = ch_data[0]
 
         time.sleep(delay)
 
@@ -245,21 +266,16 @@ def keithley_jsc(delay, points):
     print("\nPerforming keithley jsc measurement...")
 
     # Autorange keithley source votlage and measure current
-    keithley2400.write(":SOUR:FUNC VOLT")
-    keithley2400.write(":SENS:FUNC 'CURR'")
-    keithley2400.write(":SOUR:VOLT:RANG:AUTO ON")
-    keithley2400.write(":SENS:CURR:RANG:AUTO ON")
+    keithley2400.write(
+        ":SOUR:FUNC VOLT;:SENS:FUNC 'CURR';:SOUR:VOLT:RANG:AUTO ON;"
+        + ":SENS:CURR:RANG:AUTO ON"
+    )
 
     # set keithley to source zero volts and enable output
-    keithley2400.write(":SOUR:VOLT 0")
-    keithley2400.write(":OUTP ON")
-    keithley2400.write(":SYST:AZER ONCE")
+    keithley2400.write(":SOUR:VOLT 0;:OUTP ON")
 
     # run steady-state jsc
-    data = []
-    for point in range(points):
-        data.append(keithley2400.query_ascii_values(":READ?"))
-        time.sleep(delay)
+    data = keithley_read_points(points, delay)
 
     keithley2400.write(":OUTP OFF")
 
@@ -268,86 +284,112 @@ def keithley_jsc(delay, points):
     return data
 
 
-# perform measurements
-input("\nConnect device to keithley 2400 then press [Enter] to run measurements...")
-keithley_voc_data = keithley_voc(ss_delay, ss_points)
-keithley_sweep_data = keithley_sweep(start_v, stop_v, v_points)
-keithley_jsc_data = keithley_jsc(ss_delay, ss_points)
-
-input("\nConnect device to M1k then press [Enter] to run measurements...")
-m1k_voc_data = m1k_voc(ss_delay, ss_points)[0]
-m1k_sweep_data = m1k_sweep(start_v, stop_v, v_points)[0]
-m1k_jsc_data = m1k_jsc(ss_delay, ss_points)[0]
+def save_measurement(name, data):
+    """Add a completed measurement to the save file.
 
-# save measurement data
-data_dict = {
-    "m1k": {"sweep": m1k_sweep_data, "voc": m1k_voc_data, "jsc": m1k_jsc_data},
-    "keithley": {
-        "sweep": keithley_sweep_data,
-        "voc": keithley_voc_data,
-        "jsc": keithley_jsc_data,
-    },
-}
-with open(save_file, "w") as f:
-    yaml.dump(data_dict, f)
-
-# plot voc
-fig, ax = plt.subplots()
-
-for data, sm in zip([keithley_voc_data, m1k_voc_data], ["keithley", "m1k"]):
-    voltages = []
-    times = []
-    t0 = data[0][2]
-    for v, i, t, s in data:
-        voltages.append(v)
-        times.append(t - t0)
-    ax.scatter(times, voltages, label=f"{sm}")
-
-ax.tick_params(direction="in", top=True, right=True, labelsize="large")
-ax.set_xlabel("Time (s)", fontsize="large")
-ax.set_ylabel("Voc (V)", fontsize="large")
-ax.legend()
+    The file is rewritten after every measurement so completed measurements are kept
+    if the script stops part way through.
 
-fig.tight_layout()
+    Parameters
+    ----------
+    name : str
+        Name of the measurement in the save file.
+    data : list or numpy.ndarray
+        Measurement data rows of (voltage, current, time, status).
+    """
+    measurements[name] = np.asarray(data, dtype=float)
+    np.savez_compressed(save_file, **measurements)
 
-plt.show()
 
-# plot sweeps
-fig, ax = plt.subplots()
+# save measurement settings
+metadata = {
+    "nplc": nplc,
+    "settling_delay": settling_delay,
+    "plf": plf,
+    "sweep": {"start": start_v, "stop": stop_v, "points": v_points},
+    "steady_state": {"delay": ss_delay, "points": ss_points},
+}
+with open(metadata_file, "w") as f:
+    yaml.dump(metadata, f, Dumper=SafeDumper)
 
-for data, sm in zip([keithley_sweep_data, m1k_sweep_data], ["keithley", "m1k"]):
-    voltages = []
-    currents = []
-    for v, i, t, s in data:
-        voltages.append(v)
-        currents.append(i * 1000)
-    ax.scatter(voltages, currents, label=f"{sm}")
+# perform and save measurements
+measurements = {}
 
-ax.tick_params(direction="in", top=True, right=True, labelsize="large")
-ax.set_xlabel("Applied bias (V)", fontsize="large")
-ax.set_ylabel("Current (mA)", fontsize="large")
-ax.legend()
+input("\nConnect device to keithley 2400 then press [Enter] to run measurements...")
 
-fig.tight_layout()
+# zero the keithley once for all of its measurements
+keithley2400.write(":SYST:AZER ONCE")
 
-plt.show()
+keithley_voc_data = keithley_voc(ss_delay, ss_points)
+save_measurement("keithley_voc", keithley_voc_data)
+keithley_sweep_data = keithley_sweep(start_v, stop_v, v_points)
+save_measurement("keithley_sweep", keithley_sweep_data)
+keithley_jsc_data = keithley_jsc(ss_delay, ss_points)
+save_measurement("keithley_jsc", keithley_jsc_data)
 
-# plot jsc
-fig, ax = plt.subplots()
-
-for data, sm in zip([keithley_jsc_data, m1k_jsc_data], ["keithley", "m1k"]):
-    currents = []
-    times = []
-    t0 = data[0][2]
-    for v, i, t, s in data:
-        currents.append(i * 1000)
-        times.append(t - t0)
-    ax.scatter(times, currents, label=f"{sm}")
-
-ax.tick_params(direction="in", top=True, right=True, labelsize="large")
-ax.set_xlabel("Time (s)", fontsize="large")
-ax.set_ylabel("Jsc (mA)", fontsize="large")
-ax.legend()
+input("\nConnect device to M1k then press [Enter] to run measurements...")
+m1k_voc_data = m1k_voc(ss_delay, ss_points)[0]
+save_measurement("m1k_voc", m1k_voc_data)
+m1k_sweep_data = m1k_sweep(start_v, stop_v, v_points)[0]
+save_measurement("m1k_sweep", m1k_sweep_data)
+m1k_jsc_data = m1k_jsc(ss_delay, ss_points)[0]
+save_measurement("m1k_jsc", m1k_jsc_data)
+
+
+def format_axis(ax, xlabel, ylabel):
+    """Apply common formatting to a plot axis.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axis to format.
+    xlabel : str
+        x-axis label.
+    ylabel : str
+        y-axis label.
+    """
+    ax.tick_params(direction="in", top=True, right=True, labelsize="large")
+    ax.set_xlabel(xlabel, fontsize="large")
+    ax.set_ylabel(ylabel, fontsize="large")
+    ax.legend()
+
+
+# plot voc, sweeps, and jsc side by side
+fig, (ax_voc, ax_sweep, ax_jsc) = plt.subplots(1, 3, figsize=(18, 6))
+
+for sm in ["keithley", "m1k"]:
+    voc_data = measurements[f"{sm}_voc"]
+    sweep_data = measurements[f"{sm}_sweep"]
+    jsc_data = measurements[f"{sm}_jsc"]
+
+    ax_voc.plot(
+        voc_data[:, 2] - voc_data[0, 2],
+        voc_data[:, 0],
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"{sm}",
+    )
+    ax_sweep.plot(
+        sweep_data[:, 0],
+        sweep_data[:, 1] * 1000,
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"{sm}",
+    )
+    ax_jsc.plot(
+        jsc_data[:, 2] - jsc_data[0, 2],
+        jsc_data[:, 1] * 1000,
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"{sm}",
+    )
+
+format_axis(ax_voc, "Time (s)", "Voc (V)")
+format_axis(ax_sweep, "Applied bias (V)", "Current (mA)")
+format_axis(ax_jsc, "Time (s)", "Jsc (mA)")
 
 fig.tight_layout()
 
@@ -1,6 +1,8 @@
 """Calibrate ADALM1000's with a Keithley 2400 using RS232."""
 
 import argparse
+import atexit
+import concurrent.futures
 import pathlib
 import time
 import sys
@@ -10,8 +12,11 @@ import pysmu
 import pyvisa
 import yaml
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.parent.joinpath("src")))
+sys.path.insert(
+    1, str(pathlib.Path(__file__).resolve().parent.parent.parent.joinpath("src"))
+)
 import m1k.m1k as m1k
+from m1k.yaml_utils import SafeLoader, SafeDumper
 
 
 parser = argparse.ArgumentParser()
@@ -30,8 +35,9 @@ parser.add_argument(
 parser.add_argument(
     "--keithley_baud",
     type=int,
-    default=19200,
-    help="Keithley 2400 baud rate, e.g. 19200.",
+    default=57600,
+    help="Keithley 2400 baud rate, e.g. 57600 (the fastest RS-232 rate the "
+    + "instrument supports). Must match the instrument's front panel setting.",
 )
 parser.add_argument(
     "--keithley_flow",
@@ -47,6 +53,21 @@ parser.add_argument(
     choices=["CR", "LF", "CRLF"],
     help="Keithley 2400 termination character, e.g. LF",
 )
+parser.add_argument(
+    "--mux_address",
+    type=str,
+    default=None,
+    help="Relay multiplexer VISA resource address, e.g. GPIB0::9::INSTR. If given, "
+    + "wiring changes are made by the multiplexer instead of manually.",
+)
+parser.add_argument(
+    "--wiring_plan",
+    type=str,
+    default=str(pathlib.Path(__file__).resolve().parent.joinpath("wiring_plan.yaml")),
+    help="Path to yaml file listing the multiplexer commands to send for each "
+    + "wiring step and channel. See the example wiring_plan.yaml next to this script "
+    + "for the format. Only used if --mux_address is given.",
+)
 parser.add_argument(
     "--simv",
     action="store_true",
@@ -71,6 +92,8 @@ cal_data_folder = cwd.joinpath("data")
 
 # connect to keithley 2400
 rm = pyvisa.ResourceManager()
+# closing the resource manager also closes any sessions it opened
+atexit.register(rm.close)
 flow_controls = {"NONE": 0, "XON/XOFF": 1, "RTS/CTS": 2, "DTR/DSR": 4}
 term_chars = {"CR": "\r", "LF": "\n", "CRLF": "\r\n"}
 
@@ -90,6 +113,20 @@ keithley2400 = rm.open_resource(
 print(f"Keithley ID: {keithley2400.query('*IDN?')}")
 print("Connected!")
 
+# connect to relay multiplexer if wiring changes are automated
+if args.mux_address is not None:
+    print("\nConnecting to multiplexer...")
+    mux = rm.open_resource(args.mux_address)
+    print(f"Multiplexer ID: {mux.query('*IDN?')}")
+    print("Connected!")
+
+    # get multiplexer commands for each wiring step, keyed by step then channel. It's
+    # checked once the number of channels is known.
+    with open(args.wiring_plan, "r") as f:
+        wiring_plan = yaml.load(f, Loader=SafeLoader)
+else:
+    mux = None
+
 # connect to m1k's
 print("\nConnecting to SMU...")
 smu = m1k.smu(plf=args.plf, ch_per_board=2)
@@ -97,7 +134,7 @@ smu = m1k.smu(plf=args.plf, ch_per_board=2)
 # get board serial mapping
 config_file = cwd.parent.joinpath("config.yaml")
 with open(config_file, "r") as f:
-    config = yaml.load(f, Loader=yaml.FullLoader)
+    config = yaml.load(f, Loader=SafeLoader)
 
 # get list of serials in channel order
 serials = []
@@ -110,7 +147,33 @@ i_threshold = config["i_threshold"]
 # connect boards
 smu.connect(serials=serials)
 
-# set global measurement parameters
+# make sure the wiring plan covers every step and channel before starting so a run
+# can't fail part way through a calibration file
+if mux is not None:
+    if args.simv is True:
+        wiring_steps = ["measure", "simv"]
+    else:
+        wiring_steps = ["measure"]
+
+    missing = []
+    for step in wiring_steps:
+        for ch in range(smu.num_channels):
+            try:
+                cmds = wiring_plan[step][ch]
+            except (KeyError, TypeError):
+                missing.append(f"{step}: {ch}")
+            else:
+                if (type(cmds) is not list) or (len(cmds) == 0):
+                    missing.append(f"{step}: {ch}")
+
+    if missing != []:
+        raise ValueError(
+            f"Wiring plan {args.wiring_plan} doesn't have a list of multiplexer "
+            + f"commands for: {', '.join(missing)}."
+        )
+
+# set global measurement parameters. The settling delay is also used as the Keithley
+# source delay, which gives set points time to settle before each reading.
 nplc = 1
 settling_delay = 0.005
 
@@ -133,125 +196,139 @@ max_current = i_threshold
 # number of calibration points
 points = 25
 
-# set measurement data using logarithmic spacing
-cal_voltages = np.logspace(np.log10(max_voltage), np.log10(max_voltage), points)
-cal_currents_ = np.logspace(np.log10(min_current), np.log10(max_current), points)
 
-# round to instrument precision
-# rounding floats to strings can lead to duplicate values but just want the unique set
-cal_voltages = set([f"{v:6.4f}" for v in cal_voltages])
-cal_currents_0 = set([f"{i:6.4f}" for i in cal_currents_])
-cal_currents_1 = set([f"{i:6.4f}" for i in -cal_currents_])
+def format_setpoints(values):
+    """Round set points to instrument precision.
 
-# for current measurements psu and ADALM1000 see opposite polarities.
-# cal file has to list +ve current first so for ADALM1000 current measurements
-# psu should start off sourcing -ve current after 0
-cal_currents_meas = list(cal_currents_1) + list(cal_currents_0)
-# for ADALM1000 sourcing do the opposite
-cal_currents_source = list(cal_currents_0) + list(cal_currents_1)
+    Rounding floats to strings can lead to duplicate values but just want the unique
+    set, so only the first value giving each rounded string is kept.
 
-# setup keithley
-print("\nConfiguring Keithley 2400...")
-# reset
-keithley2400.write("*RST")
-# Disable the output
-keithley2400.write(":OUTP OFF")
-# Disable beeper
-keithley2400.write(":SYST:BEEP:STAT OFF")
-# Set front terminals
-keithley2400.write(":ROUT:TERM FRONT")
-# Enable 4-wire sense
-keithley2400.write(":SYST:RSEN 1")
-# Don't auto-off source after measurement
-keithley2400.write(":SOUR:CLE:AUTO OFF")
-# Set output-off mode to high impedance
-keithley2400.write(":OUTP:SMOD HIMP")
-# Make sure output never goes above 20 V
-keithley2400.write(":SOUR:VOLT:PROT 20")
-# Enable and set concurrent measurements
-keithley2400.write(":SENS:FUNC:CONC ON")
-keithley2400.write(':SENS:FUNC "CURR", "VOLT"')
-# Set read format
-keithley2400.write(":FORM:ELEM TIME,VOLT,CURR,STAT")
-# Set the integration filter (applies globally for all measurement types)
-keithley2400.write(f":SENS:CURR:NPLC {nplc}")
-# Set the delay
-keithley2400.write(f":SOUR:DEL {settling_delay}")
-# Disable autozero
-keithley2400.write(":SYST:AZER OFF")
-print("Keithley configuration complete!")
+    Parameters
+    ----------
+    values : array-like
+        Set point values.
+
+    Returns
+    -------
+    values_f : list of float
+        Unique set points at full precision, used for the SMU.
+    values_s : list of str
+        Unique set points formatted to Keithley precision.
+    """
+    values_f = np.asarray(values, dtype=float)
+    values_s = np.char.mod("%6.4f", values_f)
 
+    # keep the first occurrence of each rounded value in the original order
+    _, ixs = np.unique(values_s, return_index=True)
+    ixs.sort()
+
+    return values_f[ixs].tolist(), values_s[ixs].tolist()
 
-def measure_voltage_cal(smu, channel, save_file):
-    """Perform measurement for voltage measurement calibration of an ADALM100 channel.
+
+def source_commands(func, values_f, values_s, ranges):
+    """Build Keithley commands that set a fixed source range and level then read.
+
+    Autoranging the source makes the Keithley hunt for a range on every set point.
+    The set points are known in advance so the smallest range that fits each one can
+    be selected up front instead. When the range increases it is set before the level
+    and when it decreases it is set after, so the level always fits the range.
 
     Parameters
     ----------
-    smu : m1k.smu
-        SMU object.
-    channel : int
-        SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    func : {"VOLT", "CURR"}
+        Keithley source function.
+    values_f : list of float
+        Set points.
+    values_s : list of str
+        Set points formatted to Keithley precision.
+    ranges : list of float
+        Available Keithley source ranges in ascending order.
+
+    Returns
+    -------
+    commands : list of str
+        Compound command setting the source range and level, and triggering a
+        reading, for each set point.
     """
-    global cal_dict
+    commands = []
+    last_rng = None
+    for value_f, value_s in zip(values_f, values_s):
+        # the keithley can source up to 105% of a range
+        rng = ranges[-1]
+        for r in ranges:
+            if abs(value_f) <= 1.05 * r:
+                rng = r
+                break
 
-    print(f"\nPerforming CH{channel + 1} measure voltage calibration measurement...")
+        if (last_rng is None) or (rng >= last_rng):
+            commands.append(f":SOUR:{func}:RANG {rng:g};:SOUR:{func} {value_s};:READ?")
+        else:
+            commands.append(f":SOUR:{func} {value_s};:SOUR:{func}:RANG {rng:g};:READ?")
+        last_rng = rng
 
-    # get smu sub-channel letter
-    dev_channel = smu.channel_settings[channel]["dev_channel"]
+    return commands
 
-    # Autorange keithley source votlage and measure current
-    keithley2400.write(":SOUR:FUNC VOLT")
-    keithley2400.write(':SENS:FUNC "CURR"')
-    keithley2400.write(":SOUR:VOLT:RANG:AUTO ON")
-    keithley2400.write(":SENS:CURR:RANG:AUTO ON")
-
-    # set smu to measure voltage in high impedance mode
-    smu.enable_output(False, channel)
 
-    # set keithley to source zero volts and enable output
-    keithley2400.write(":SOUR:VOLT 0")
-    keithley2400.write(":OUTP ON")
-    keithley2400.write(":SYST:AZER ONCE")
-
-    if save_file.exists() is True:
-        write_mode = "a"
-    else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, measure V\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_meas_v = {"smu": [], "dmm": []}
-        for v in cal_voltages:
-            keithley2400.write(f":SOUR:VOLT {v}")
-            time.sleep(0.1)
-            keithley_data = keithley2400.query_ascii_values(":READ?")
-            keithley_v = keithley_data[0]
+# set measurement data using logarithmic spacing
+cal_voltages = np.logspace(np.log10(min_voltage), np.log10(max_voltage), points)
+cal_currents_ = np.logspace(np.log10(min_current), np.log10(max_current), points)
 
-            smu_v = smu.measure(channel, measurement="dc")[channel][0][0]
+# keep float and formatted string versions of the set points in parallel
+cal_voltages_f, cal_voltages_s = format_setpoints(cal_voltages)
+cal_currents_0_f, cal_currents_0_s = format_setpoints(cal_currents_)
+cal_currents_1_f, cal_currents_1_s = format_setpoints(-cal_currents_)
 
-            f.write(f"<{keithley_v:6.4f}, {smu_v:7.5f}>\n")
+# for current measurements psu and ADALM1000 see opposite polarities.
+# cal file has to list +ve current first so for ADALM1000 current measurements
+# psu should start off sourcing -ve current after 0
+cal_currents_meas_f = cal_currents_1_f + cal_currents_0_f
+cal_currents_meas_s = cal_currents_1_s + cal_currents_0_s
+# for ADALM1000 sourcing do the opposite
+cal_currents_source_f = cal_currents_0_f + cal_currents_1_f
 
-            cal_ch_meas_v["smu"].extend([smu_v])
-            cal_ch_meas_v["dmm"].extend([keithley_v])
-            print(f"Keithley: {keithley_v:6.4f}, SMU: {smu_v:7.5f}")
+# fixed keithley source range and level commands for the keithley-sourced sweeps
+keithley_v_ranges = [0.2, 2, 20, 200]
+keithley_i_ranges = [1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1]
+cal_voltages_cmds = source_commands(
+    "VOLT", cal_voltages_f, cal_voltages_s, keithley_v_ranges
+)
+cal_currents_meas_cmds = source_commands(
+    "CURR", cal_currents_meas_f, cal_currents_meas_s, keithley_i_ranges
+)
 
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["meas_v"] = cal_ch_meas_v
+# setup keithley
+print("\nConfiguring Keithley 2400...")
+# reset, disable the output and beeper, set front terminals, enable 4-wire sense,
+# don't auto-off source after measurement, set output-off mode to high impedance,
+# and make sure output never goes above 20 V
+keithley2400.write(
+    "*RST;:OUTP OFF;:SYST:BEEP:STAT OFF;:ROUT:TERM FRONT;:SYST:RSEN 1;"
+    + ":SOUR:CLE:AUTO OFF;:OUTP:SMOD HIMP;:SOUR:VOLT:PROT 20"
+)
+# enable and set concurrent measurements, set read format (binary formats aren't
+# available over RS-232 so make sure it's ASCII), set the integration filter
+# (applies globally for all measurement types), set the delay, and disable
+# autozero
+keithley2400.write(
+    ':SENS:FUNC:CONC ON;:SENS:FUNC "CURR", "VOLT";:FORM:DATA ASC;'
+    + ":FORM:ELEM VOLT,CURR;"
+    + f":SENS:CURR:NPLC {nplc};:SOUR:DEL {settling_delay};"
+    + ":SYST:AZER OFF"
+)
+print("Keithley configuration complete!")
 
-    # turn off smu outputs
-    keithley2400.write(":SOUR:VOLT 0")
-    keithley2400.write(":OUTP OFF")
+# worker thread for running SMU measurements concurrently with Keithley reads
+smu_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
-    print(f"CH{channel + 1} measure voltage calibration measurement complete!")
 
+def run_cal(
+    smu, channel, f, label, key, keithley_config, keithley_zero, smu_mode, set_points
+):
+    """Perform a calibration measurement sweep on an ADALM1000 channel.
 
-def measure_current_cal(smu, channel, save_file):
-    """Perform measurement for current measurement calibration of an ADALM100 channel.
+    For measure calibrations the Keithley sources the set points while the SMU
+    measures. For source calibrations the SMU sources the set points while the
+    Keithley measures.
 
     Parameters
     ----------
@@ -259,70 +336,108 @@ def measure_current_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
+    label : str
+        Calibration label used in the save file, e.g. "measure V".
+    key : {"meas_v", "meas_i", "source_v", "source_i"}
+        Calibration dictionary key.
+    keithley_config : str
+        Keithley commands configuring the source and sense functions and ranges.
+    keithley_zero : str
+        Keithley command setting the source to zero.
+    smu_mode : {"v", "i"} or None
+        SMU source mode. If `None` the SMU output is disabled, i.e. it measures in
+        high impedance mode.
+    set_points : list of str or list of float
+        Keithley commands setting each source level and triggering a reading for
+        measure calibrations, or SMU source values for source calibrations.
     """
     global cal_dict
 
-    print(f"\nPerforming CH{channel + 1} measure current calibration measurement...")
+    print(f"\nPerforming CH{channel + 1} {label} calibration measurement...")
 
     # get smu sub-channel letter
     dev_channel = smu.channel_settings[channel]["dev_channel"]
 
-    # Autorange keithley source votlage and measure current
-    keithley2400.write(":SOUR:FUNC CURR")
-    keithley2400.write(":SENS:FUNC 'VOLT'")
-    keithley2400.write(":SOUR:CURR:RANG:AUTO ON")
-    keithley2400.write(":SENS:VOLT:RANG:AUTO ON")
+    keithley_sources = key.startswith("meas")
 
-    # set m1k to source voltage, measure current and set voltage to 0
-    smu.configure_dc({channel: 0}, source_mode="v")
-    smu.enable_output(True, channel)
+    # voltages are in the first column of the data and currents are in the second.
+    # reverse polarity of currents as SMU's are seeing opposites
+    if key.endswith("v"):
+        column = 0
+        polarity = 1
+    else:
+        column = 1
+        polarity = -1
 
-    # set keithley to source zero volts and enable output
-    keithley2400.write(":SOUR:CURR 0")
-    keithley2400.write(":OUTP ON")
-    keithley2400.write(":SYST:AZER ONCE")
+    keithley2400.write(keithley_config)
 
-    if save_file.exists() is True:
-        write_mode = "a"
+    # set smu output, starting from zero if enabled
+    if smu_mode is None:
+        smu.enable_output(False, channel)
     else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, measure I\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_meas_i = {"smu": [], "dmm": []}
-        for i in cal_currents_meas:
-            keithley2400.write(f":SOUR:CURR {i}")
-            time.sleep(0.1)
-            keithley_data = keithley2400.query_ascii_values(":READ?")
-            # reverse polarity as SMU's are seeing opposites
-            keithley_i = -keithley_data[1]
+        smu.configure_dc({channel: 0}, source_mode=smu_mode)
+        smu.enable_output(True, channel)
 
-            smu_i = smu.measure(channel, measurement="dc")[channel][0][1]
+    # set keithley to source zero and enable output
+    keithley2400.write(f"{keithley_zero};:OUTP ON")
 
-            f.write(f"<{keithley_i:6.4f}, {smu_i:7.5f}>\n")
+    # measure
+    if keithley_sources is True:
+        cal_ch = {"smu": [], "dmm": []}
+    else:
+        cal_ch = {"set": [], "smu": [], "dmm": []}
+    for set_point in set_points:
+        if keithley_sources is True:
+            # set the source and take a reading in one transaction. The reading only
+            # returns once the keithley output has changed, so the smu must not
+            # measure until afterwards.
+            keithley_data = keithley2400.query_ascii_values(set_point)
+            smu_data = smu.measure(channel, measurement="dc")
+        else:
+            smu.configure_dc({channel: set_point}, source_mode=smu_mode)
+
+            # the keithley's source delay is timed from its own trigger, not from the
+            # smu output changing, so wait for the smu output to settle before the
+            # keithley reference reading
+            time.sleep(smu.settling_delay)
+
+            # measure with the smu in the background while the keithley reads
+            smu_future = smu_executor.submit(smu.measure, channel, measurement="dc")
+            keithley_data = keithley2400.query_ascii_values(":READ?")
+            smu_data = smu_future.result()
 
-            cal_ch_meas_i["smu"].extend([smu_i])
-            cal_ch_meas_i["dmm"].extend([keithley_i])
-            print(f"Keithley: {keithley_i:6.4f}, SMU: {smu_i:7.5f}")
+        keithley_value = polarity * keithley_data[column]
+        smu_value = smu_data[channel][0][column]
 
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["meas_i"] = cal_ch_meas_i
+        if keithley_sources is False:
+            cal_ch["set"].append(set_point)
+        cal_ch["smu"].append(smu_value)
+        cal_ch["dmm"].append(keithley_value)
+        print(f"Keithley: {keithley_value:6.4f}, SMU: {smu_value:7.5f}")
 
-    # turn off smu outputs
+    # save the section in the order required by the cal file
+    if keithley_sources is True:
+        columns = (cal_ch["dmm"], cal_ch["smu"])
+        fmt = "<%6.4f, %7.5f>"
+    else:
+        columns = (cal_ch["smu"], cal_ch["dmm"])
+        fmt = "<%7.5f, %6.4f>"
+    f.write(f"# Channel {channel}, {label}\n</>\n")
+    np.savetxt(f, np.column_stack(columns), fmt=fmt)
+    f.write("<\>\n\n")
+    cal_dict[dev_channel][key] = cal_ch
+
+    # turn off outputs
     smu.enable_output(False, channel)
-    keithley2400.write(":SOUR:CURR 0")
-    keithley2400.write(":OUTP OFF")
+    keithley2400.write(f"{keithley_zero};:OUTP OFF")
 
-    print(f"CH{channel + 1} measure current calibration measurement complete!")
+    print(f"CH{channel + 1} {label} calibration measurement complete!")
 
 
-def source_voltage_cal(smu, channel, save_file):
-    """Perform measurement for voltage source calibration of an ADALM100 channel.
+def measure_voltage_cal(smu, channel, f):
+    """Perform measurement for voltage measurement calibration of an ADALM100 channel.
 
     Parameters
     ----------
@@ -330,69 +445,81 @@ def source_voltage_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
     """
-    global cal_dict
-
-    print(f"\nPerforming CH{channel + 1} source voltage calibration measurement...")
-
-    # get smu sub-channel letter
-    dev_channel = smu.channel_settings[channel]["dev_channel"]
-
-    # Autorange keithley source votlage and measure current
-    keithley2400.write(":SOUR:FUNC CURR")
-    keithley2400.write(":SENS:FUNC 'VOLT'")
-    keithley2400.write(":SOUR:CURR:RANG:AUTO ON")
-    keithley2400.write(":SENS:VOLT:RANG:AUTO ON")
-
-    # set smu to source voltage, measure current and set voltage to 0
-    smu.configure_dc({channel: 0}, source_mode="v")
-    smu.enable_output(True, channel)
-
-    # set keithley to source zero volts and enable output
-    keithley2400.write(":SOUR:CURR 0")
-    keithley2400.write(":OUTP ON")
-    keithley2400.write(":SYST:AZER ONCE")
-
-    if save_file.exists() is True:
-        write_mode = "a"
-    else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, source V\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_sour_v = {"set": [], "smu": [], "dmm": []}
-        for v in cal_voltages:
-            smu.configure_dc({channel: float(v)}, source_mode="v")
-            time.sleep(0.1)
-
-            keithley_data = keithley2400.query_ascii_values(":READ?")
-            keithley_v = keithley_data[0]
+    # Fixed range keithley source votlage and autorange measure current. SMU
+    # measures in high impedance mode.
+    run_cal(
+        smu,
+        channel,
+        f,
+        "measure V",
+        "meas_v",
+        ':SOUR:FUNC VOLT;:SENS:FUNC "CURR";:SOUR:VOLT:RANG:AUTO OFF;'
+        + ":SENS:CURR:RANG:AUTO ON",
+        ":SOUR:VOLT 0",
+        None,
+        cal_voltages_cmds,
+    )
 
-            smu_v = smu.measure(channel, measurement="dc")[channel][0][0]
 
-            f.write(f"<{smu_v:7.5f}, {keithley_v:6.4f}>\n")
+def measure_current_cal(smu, channel, f):
+    """Perform measurement for current measurement calibration of an ADALM100 channel.
 
-            cal_ch_sour_v["set"].extend([float(v)])
-            cal_ch_sour_v["smu"].extend([smu_v])
-            cal_ch_sour_v["dmm"].extend([keithley_v])
-            print(f"SMU: {smu_v:7.5f}, Keithley: {keithley_v:6.4f}")
+    Parameters
+    ----------
+    smu : m1k.smu
+        SMU object.
+    channel : int
+        SMU channel number.
+    f : file object
+        Open save file formatted for internal calibration.
+    """
+    # Fixed range keithley source current and autorange measure voltage. SMU sources
+    # 0 V and measures current.
+    run_cal(
+        smu,
+        channel,
+        f,
+        "measure I",
+        "meas_i",
+        ":SOUR:FUNC CURR;:SENS:FUNC 'VOLT';:SOUR:CURR:RANG:AUTO OFF;"
+        + ":SENS:VOLT:RANG:AUTO ON",
+        ":SOUR:CURR 0",
+        "v",
+        cal_currents_meas_cmds,
+    )
 
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["source_v"] = cal_ch_sour_v
 
-    # turn off smu outputs
-    smu.enable_output(False, channel)
-    keithley2400.write(":OUTP OFF")
+def source_voltage_cal(smu, channel, f):
+    """Perform measurement for voltage source calibration of an ADALM100 channel.
 
-    print(f"CH{channel + 1} source voltage calibration measurement complete!")
+    Parameters
+    ----------
+    smu : m1k.smu
+        SMU object.
+    channel : int
+        SMU channel number.
+    f : file object
+        Open save file formatted for internal calibration.
+    """
+    # Autorange keithley source 0 A and measure voltage. SMU sources voltage.
+    run_cal(
+        smu,
+        channel,
+        f,
+        "source V",
+        "source_v",
+        ":SOUR:FUNC CURR;:SENS:FUNC 'VOLT';:SOUR:CURR:RANG:AUTO ON;"
+        + ":SENS:VOLT:RANG:AUTO ON",
+        ":SOUR:CURR 0",
+        "v",
+        cal_voltages_f,
+    )
 
 
-def source_current_cal(smu, channel, save_file):
+def source_current_cal(smu, channel, f):
     """Perform measurement for current source calibration of an ADALM100 channel.
 
     Parameters
@@ -401,73 +528,52 @@ def source_current_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
     """
-    global cal_dict
-
-    print(f"\nPerforming CH{channel + 1} source current calibration measurement...")
-
-    # get smu sub-channel letter
-    dev_channel = smu.channel_settings[channel]["dev_channel"]
-
-    # Autorange keithley source votlage and measure current
-    keithley2400.write(":SOUR:FUNC VOLT")
-    keithley2400.write(":SENS:FUNC 'CURR'")
-    keithley2400.write(":SOUR:VOLT:RANG:AUTO ON")
-    keithley2400.write(":SENS:CURR:RANG:AUTO ON")
+    # Autorange keithley source 0 V and measure current with a current compliance.
+    # SMU sources current.
+    run_cal(
+        smu,
+        channel,
+        f,
+        "source I",
+        "source_i",
+        ":SOUR:FUNC VOLT;:SENS:FUNC 'CURR';:SOUR:VOLT:RANG:AUTO ON;"
+        + ":SENS:CURR:RANG:AUTO ON;:SENS:CURR:PROT 0.25",
+        ":SOUR:VOLT 0",
+        "i",
+        cal_currents_source_f,
+    )
 
-    # set smu to source current, measure voltage and set current to 0
-    smu.configure_dc({channel: 0}, source_mode="i")
-    smu.enable_output(True, channel)
 
-    # set the current compliance
-    keithley2400.write(":SENS:CURR:PROT 0.25")
+def set_wiring(channel, step, message):
+    """Connect the Keithley to an SMU channel for a calibration step.
 
-    # set keithley to source zero volts and enable output
-    keithley2400.write(":SOUR:VOLT 0")
-    keithley2400.write(":OUTP ON")
-    keithley2400.write(":SYST:AZER ONCE")
+    If a multiplexer is connected the wiring plan commands for the step are sent to
+    it, otherwise the user is prompted to make the connections manually.
 
-    if save_file.exists() is True:
-        write_mode = "a"
+    Parameters
+    ----------
+    channel : int
+        SMU channel number.
+    step : str
+        Wiring step name in the wiring plan, either "measure" or "simv".
+    message : str
+        Description of the required connections.
+    """
+    if mux is None:
+        input(f"\n{message} Press Enter when ready...")
     else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, source I\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_sour_i = {"set": [], "smu": [], "dmm": []}
-        for i in cal_currents_source:
-            smu.configure_dc({channel: float(i)}, source_mode="i")
-            time.sleep(0.1)
-
-            keithley_data = keithley2400.query_ascii_values(":READ?")
-            # reverse polarity as SMU's are seeing opposites
-            keithley_i = -keithley_data[1]
-
-            smu_i = smu.measure(channel, measurement="dc")[channel][0][1]
-
-            f.write(f"<{smu_i:7.5f}, {keithley_i:6.4f}>\n")
+        print(f"\n{message}")
+        for cmd in wiring_plan[step][channel]:
+            mux.write(cmd)
 
-            cal_ch_sour_i["set"].extend([float(i)])
-            cal_ch_sour_i["smu"].extend([smu_i])
-            cal_ch_sour_i["dmm"].extend([keithley_i])
-            print(f"set: {i}, SMU: {smu_i:6.4f}, Keithley: {keithley_i:7.5f}")
+        # wait for the relays to finish switching before measuring
+        mux.query("*OPC?")
 
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["source_i"] = cal_ch_sour_i
 
-    # turn off smu outputs
-    smu.enable_output(False, channel)
-    keithley2400.write(":OUTP OFF")
-
-    print(f"CH{channel + 1} source voltage calibration measurement complete!")
-
-
-def channel_cal(smu, channel, save_file):
+def channel_cal(smu, channel, f):
     """Run all calibration measurements for a channel.
 
     Parameters
@@ -476,38 +582,46 @@ def channel_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
     """
-    input(
-        f"\nConnect Keithley HI to SMU CH {channel + 1} HI and Keithley LO to SMU CH "
-        + f"{channel + 1} GND. Press Enter when ready..."
+    set_wiring(
+        channel,
+        "measure",
+        f"Connect Keithley HI to SMU CH {channel + 1} HI and Keithley LO to SMU CH "
+        + f"{channel + 1} GND.",
     )
-    measure_voltage_cal(smu, channel, save_file)
-    source_voltage_cal(smu, channel, save_file)
-    measure_current_cal(smu, channel, save_file)
+    measure_voltage_cal(smu, channel, f)
+    source_voltage_cal(smu, channel, f)
+    measure_current_cal(smu, channel, f)
 
     if args.simv is True:
-        input(
-            f"\nConnect Keithley HI to SMU CH {channel + 1} HI and Keithley LO to SMU "
-            + f"CH {channel + 1} 2.5 V. Press Enter when ready..."
+        set_wiring(
+            channel,
+            "simv",
+            f"Connect Keithley HI to SMU CH {channel + 1} HI and Keithley LO to SMU "
+            + f"CH {channel + 1} 2.5 V.",
         )
-        source_current_cal(smu, channel, save_file)
+        source_current_cal(smu, channel, f)
 
 
 # perform calibration measurements in exact order required for cal file
-t = time.time()
+timestamp = int(time.time())
 for board in range(smu.num_boards):
     board_serial = smu.get_channel_id(2 * board)
 
-    cal = input(f"\nDo you wish to calibrate {board_serial}? [y/n] ")
+    # calibrate every board without asking when wiring changes are automated
+    if mux is None:
+        cal = input(f"\nDo you wish to calibrate {board_serial}? [y/n] ")
+    else:
+        cal = "y"
 
     if cal == "y":
         # m1k internal calibration file
-        save_file = cal_data_folder.joinpath(f"cal_{int(t)}_{board_serial}.txt")
+        save_file = cal_data_folder.joinpath(f"cal_{timestamp}_{board_serial}.txt")
 
         # save calibration dictionary in same folder
-        save_file_dict = cal_data_folder.joinpath(f"cal_{int(t)}_{board_serial}.yaml")
+        save_file_dict = save_file.with_suffix(".yaml")
         cal_dict = {
             "A": {"meas_v": None, "meas_i": None, "source_v": None, "source_i": None},
             "B": {"meas_v": None, "meas_i": None, "source_v": None, "source_i": None},
@@ -517,13 +631,19 @@ for board in range(smu.num_boards):
         channel_A_num = 2 * board
         channel_B_num = 2 * board + 1
 
-        # run calibrations
-        channel_cal(smu, channel_A_num, save_file)
-        channel_cal(smu, channel_B_num, save_file)
+        # zero the keithley once for all of this board's calibration measurements
+        keithley2400.write(":SYST:AZER ONCE")
+
+        # run calibrations, keeping the save file open for all of them
+        with open(save_file, "w", encoding="ascii") as f:
+            channel_cal(smu, channel_A_num, f)
+            channel_cal(smu, channel_B_num, f)
 
         # export calibration dictionary to a yaml file
         with open(save_file_dict, "w") as f:
-            yaml.dump(cal_dict, f)
+            yaml.dump(cal_dict, f, Dumper=SafeDumper)
+
+smu_executor.shutdown()
 
 smu.set_leds(R=True)
 
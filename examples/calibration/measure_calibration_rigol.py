@@ -1,19 +1,22 @@
 """Calibrate ADALM1000's with a Rigol DM3058E DMM and Rigol DP821A PSU using RS232."""
 
 import argparse
+import concurrent.futures
 import pathlib
 import time
 import sys
 
 import numpy as np
-import pyvisa
 import yaml
 
 import dp800
 import dm3058
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.parent.joinpath("src")))
+sys.path.insert(
+    1, str(pathlib.Path(__file__).resolve().parent.parent.parent.joinpath("src"))
+)
 import m1k.m1k as m1k
+from m1k.yaml_utils import SafeLoader, SafeDumper
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -26,19 +29,22 @@ parser.add_argument(
     "--dmm_address",
     type=str,
     default="ASRL3::INSTR",
-    help="Rigol DMM VISA resource address, e.g. ASRL3::INSTR",
+    help="Rigol DMM VISA resource address, e.g. ASRL3::INSTR, or a USB address to "
+    + "use USB-TMC instead of RS232.",
 )
 parser.add_argument(
     "--psu_address",
     type=str,
     default="ASRL4::INSTR",
-    help="Rigol PSU VISA resource address, e.g. ASRL4::INSTR",
+    help="Rigol PSU VISA resource address, e.g. ASRL4::INSTR, or a USB address to "
+    + "use USB-TMC instead of RS232.",
 )
 parser.add_argument(
     "--rigol_baud",
     type=int,
-    default=19200,
-    help="Rigol DMM and PSU baud rate, e.g. 19200.",
+    default=115200,
+    help="Rigol DMM and PSU baud rate, e.g. 115200 (the fastest rate both "
+    + "instruments support). Must match the instruments' front panel settings.",
 )
 parser.add_argument(
     "--rigol_flow",
@@ -88,30 +94,51 @@ cwd = pathlib.Path.cwd()
 cal_data_folder = cwd.joinpath("data")
 
 # connect to Rigol DM3058E DMM and Rigol DP821A PSU
-rm = pyvisa.ResourceManager()
 flow_controls = {"NONE": 0, "XON/XOFF": 1, "RTS/CTS": 2, "DTR/DSR": 4}
 term_chars = {"CR": "\r", "LF": "\n", "CRLF": "\r\n"}
 
-print("\nConnecting to Rigol DM3058E DMM...")
-dmm_address = args.dmm_address
 rigol_baud = args.rigol_baud
 rigol_flow_control = flow_controls[args.rigol_flow]
 rigol_term_char = term_chars[args.rigol_term]
 
-rigol_kwargs = {}
-if dmm_address.startswith("ASRL"):
-    rigol_kwargs = {
-        "baud_rate": rigol_baud,
-        "flow_control": rigol_flow_control,
-        "write_termination": rigol_term_char,
-        "read_termination": rigol_term_char,
-    }
+
+def rigol_kwargs(address):
+    """Get VISA resource settings for a Rigol instrument.
+
+    Parameters
+    ----------
+    address : str
+        VISA resource address.
+
+    Returns
+    -------
+    kwargs : dict
+        Resource settings. Serial settings are only included for serial addresses.
+    """
+    # set timing explicitly rather than relying on VISA defaults, responses are short
+    # so the default chunk size is fine
+    kwargs = {"timeout": 5000, "query_delay": 0}
+    if address.startswith("ASRL"):
+        kwargs.update(
+            {
+                "baud_rate": rigol_baud,
+                "flow_control": rigol_flow_control,
+                "write_termination": rigol_term_char,
+                "read_termination": rigol_term_char,
+            }
+        )
+
+    return kwargs
+
+
+print("\nConnecting to Rigol DM3058E DMM...")
+dmm_address = args.dmm_address
 
 dmm = dm3058.dm3058()
 dmm.connect(
     dmm_address,
     reset=False,
-    **rigol_kwargs,
+    **rigol_kwargs(dmm_address),
 )
 print(f"Rigol DM3058E ID: {dmm.get_id()}")
 print("Connected!")
@@ -123,7 +150,7 @@ psu = dp800.dp800()
 psu.connect(
     psu_address,
     reset=False,
-    **rigol_kwargs,
+    **rigol_kwargs(psu_address),
 )
 print(f"Rigol DP821A ID: {psu.get_id()}")
 print("Connected!")
@@ -135,7 +162,7 @@ smu = m1k.smu(plf=args.plf, ch_per_board=2)
 # get board serial mapping
 config_file = cwd.parent.joinpath("config.yaml")
 with open(config_file, "r") as f:
-    config = yaml.load(f, Loader=yaml.FullLoader)
+    config = yaml.load(f, Loader=SafeLoader)
 
 # get list of serials in channel order
 serials = []
@@ -169,6 +196,10 @@ min_current = 0.0001
 max_voltage = 5
 max_current = i_threshold
 
+# psu compliance limits when sourcing current and voltage, respectively
+psu_voltage_limit = 11
+psu_current_limit = 0.05
+
 # number of calibration points
 points = 25
 
@@ -182,110 +213,100 @@ cal_voltages_source = np.logspace(
 cal_currents_ = np.logspace(np.log10(min_current), np.log10(max_current), points)
 
 # round to instrument precision
-# rounding floats to strings can lead to duplicate values but just want the unique set
-cal_voltages_meas = sorted(list(set([f"{v:6.4f}" for v in cal_voltages_meas])))
-cal_voltages_source = sorted(list(set([f"{v:6.4f}" for v in cal_voltages_source])))
-cal_currents_0 = sorted(list(set([f"{i:6.4f}" for i in cal_currents_])))
-cal_currents_1 = sorted(list(set([f"{i:6.4f}" for i in -cal_currents_])))
-
-# for current measurements psu and ADALM1000 see opposite polarities.
-# cal file has to list +ve current first so for ADALM1000 current measurements
-# psu should start off sourcing -ve current after 0
-cal_currents_meas = cal_currents_1 + cal_currents_0
-# for ADALM1000 sourcing do the opposite
-cal_currents_source = cal_currents_0 + cal_currents_1
-
-# setup multimeter
-print("\nConfiguring DMM...")
-dmm.enable_autorange(True)
-print("DMM configuration complete!")
-
-# setup psu
-print("\nConfiguring PSU...")
-# disable output for ch 1
-psu.set_output_enable(False, 1)
-
-# set overcurrent protection for ch 1
-psu.set_ocp_value(0.21, 1)
-psu.set_ocp_enable(True, 1)
-
-# set overvoltage protection for ch 1
-psu.set_ovp_value(11, 1)
-psu.set_ovp_enable(True, 1)
-print("PSU configuration complete!")
-
-
-def measure_voltage_cal(smu, channel, save_file):
-    """Perform measurement for voltage measurement calibration of an ADALM100 channel.
+# rounding can lead to duplicate values but just want the unique set, sorted by
+# increasing magnitude. Keep as native floats for the instrument drivers and yaml.
+cal_voltages_meas = np.unique(np.round(cal_voltages_meas, 4)).tolist()
+cal_voltages_source = np.unique(np.round(cal_voltages_source, 4)).tolist()
+cal_currents_mag = np.unique(np.round(cal_currents_, 4))
+cal_currents_0 = cal_currents_mag.tolist()
+cal_currents_1 = (-cal_currents_mag).tolist()
 
-    Parameters
-    ----------
-    smu : m1k.smu
-        SMU object.
-    channel : int
-        SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
-    """
-    global cal_dict
+# cal file has to list +ve current first. For ADALM1000 current measurements the psu
+# sources cal_currents_0 then cal_currents_1 with its polarity reversed in between.
+# For ADALM1000 sourcing the SMU sweeps both polarities in one go.
+cal_currents_source = np.concatenate((cal_currents_mag, -cal_currents_mag)).tolist()
 
-    print(f"\nPerforming CH{channel + 1} measure voltage calibration measurement...")
 
-    # get smu sub-channel letter
-    dev_channel = smu.channel_settings[channel]["dev_channel"]
+def configure_dmm():
+    """Configure the DMM."""
+    dmm.enable_autorange(True)
 
-    # set dmm to measure voltage
-    dmm.set_function("voltage", "dc")
-    dmm.set_dc_voltage_measurement_impedance("10G")
-    dmm.set_reading_rate("voltage", "dc", "S")
 
-    # set psu to source zero volts and enable output
-    max_current = 0.05
-    psu.set_apply(channel=1, voltage=0, current=max_current)
-    psu.set_output_enable(True, 1)
+def configure_psu():
+    """Configure the PSU."""
+    # disable output for ch 1
+    psu.set_output_enable(False, 1)
 
-    # set smu to measure voltage in high impedance mode
-    smu.enable_output(False, channel)
+    # set overcurrent protection for ch 1
+    psu.set_ocp_value(0.21, 1)
+    psu.set_ocp_enable(True, 1)
 
-    if save_file.exists() is True:
-        write_mode = "a"
-    else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, measure V\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_meas_v = {"smu": [], "dmm": []}
-        for v in cal_voltages_meas:
-            psu.set_apply(channel=1, voltage=float(v), current=max_current)
-            time.sleep(args.delay)
+    # set overvoltage protection for ch 1
+    psu.set_ovp_value(11, 1)
+    psu.set_ovp_enable(True, 1)
 
-            [dmm.measure("voltage", "dc") for _ in range(dummys)]
-            dmm_vs = [dmm.measure("voltage", "dc") for _ in range(avs)]
-            dmm_v = sum(dmm_vs) / len(dmm_vs)
 
-            smu_v = smu.measure(channel, measurement="dc")[channel][0][0]
+# the dmm and psu are on separate ports so configure them at the same time
+print("\nConfiguring DMM and PSU...")
+with concurrent.futures.ThreadPoolExecutor(max_workers=2) as setup_executor:
+    setup_futures = [
+        setup_executor.submit(configure_dmm),
+        setup_executor.submit(configure_psu),
+    ]
+    # re-raise any configuration errors
+    for future in concurrent.futures.as_completed(setup_futures):
+        future.result()
+print("DMM and PSU configuration complete!")
 
-            f.write(f"<{dmm_v:6.4f}, {smu_v:7.5f}>\n")
+# worker thread for running SMU measurements concurrently with DMM reads
+smu_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
-            cal_ch_meas_v["smu"].extend([smu_v])
-            cal_ch_meas_v["dmm"].extend([dmm_v])
-            print(f"set: {v}, DMM: {dmm_v:7.5f}, SMU: {smu_v:7.5f}")
 
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["meas_v"] = cal_ch_meas_v
+def read_dmm(function):
+    """Read the DMM, discarding settling readings and averaging the rest.
 
-    # turn off instrument outputs
-    psu.set_apply(channel=1, voltage=0, current=max_current)
-    psu.set_output_enable(False, 1)
+    Parameters
+    ----------
+    function : {"voltage", "current"}
+        DC measurement function.
 
-    print(f"CH{channel + 1} measure voltage calibration measurement complete!")
+    Returns
+    -------
+    reading : float
+        Average DMM reading.
+    """
+    for _ in range(dummys):
+        dmm.measure(function, "dc")
+
+    readings = np.fromiter(
+        (dmm.measure(function, "dc") for _ in range(avs)), dtype=float, count=avs
+    )
 
+    # native float so it serialises cleanly to yaml
+    return float(readings.mean())
 
-def measure_current_cal(smu, channel, save_file):
-    """Perform measurement for current measurement calibration of an ADALM100 channel.
+
+def set_psu(function, value):
+    """Set the PSU CH1 output level.
+
+    Parameters
+    ----------
+    function : {"voltage", "current"}
+        PSU source function. The other function is set to its limit.
+    value : float
+        Source level.
+    """
+    if function == "voltage":
+        psu.set_apply(channel=1, voltage=value, current=psu_current_limit)
+    else:
+        psu.set_apply(channel=1, voltage=psu_voltage_limit, current=value)
+
+
+def run_cal(smu, channel, f, label, key, smu_mode, set_points):
+    """Perform a calibration measurement sweep on an ADALM1000 channel.
+
+    For measure calibrations the PSU sources the set points while the SMU measures.
+    For source calibrations the SMU sources the set points while the DMM measures.
 
     Parameters
     ----------
@@ -293,92 +314,113 @@ def measure_current_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
+    label : str
+        Calibration label used in the save file, e.g. "measure V".
+    key : {"meas_v", "meas_i", "source_v", "source_i"}
+        Calibration dictionary key.
+    smu_mode : {"v", "i"} or None
+        SMU source mode. If `None` the SMU output is disabled, i.e. it measures in
+        high impedance mode.
+    set_points : list of list of float
+        Segments of set points to source. The user is prompted to reverse the
+        polarity of the PSU outputs between segments.
     """
     global cal_dict
 
-    print(f"\nPerforming CH{channel + 1} measure current calibration measurement...")
+    print(f"\nPerforming CH{channel + 1} {label} calibration measurement...")
 
     # get smu sub-channel letter
     dev_channel = smu.channel_settings[channel]["dev_channel"]
 
-    # setup dmm to measure current
-    dmm.set_function("current", "dc")
-    dmm.set_reading_rate("current", "dc", "S")
-
-    # set m1k to source voltage, measure current and set voltage to 0
-    smu.configure_dc({channel: 0}, source_mode="v")
-    smu.enable_output(True, channel)
+    psu_sources = key.startswith("meas")
 
-    # set psu to source 0 A and enable output
-    max_voltage = 11
-    psu.set_apply(channel=1, voltage=max_voltage, current=0)
-    psu.set_output_enable(True, 1)
-
-    if save_file.exists() is True:
-        write_mode = "a"
+    # voltages are in the first column of the smu data and currents are in the
+    # second. reverse polarity of currents as SMU's are seeing opposites
+    if key.endswith("v"):
+        function = "voltage"
+        column = 0
+        polarity = 1
     else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, measure I\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_meas_i = {"smu": [], "dmm": []}
-        for i in cal_currents_0:
-            psu.set_apply(channel=1, voltage=max_voltage, current=float(i))
-            time.sleep(args.delay)
-
-            # reverse polarity as SMU's are seeing opposites
-            [dmm.measure("current", "dc") for _ in range(dummys)]
-            dmm_is = [-dmm.measure("current", "dc") for _ in range(avs)]
-            dmm_i = sum(dmm_is) / len(dmm_is)
-
-            smu_i = smu.measure(channel, measurement="dc")[channel][0][1]
-
-            f.write(f"<{dmm_i:6.4f}, {smu_i:7.5f}>\n")
-
-            cal_ch_meas_i["smu"].extend([smu_i])
-            cal_ch_meas_i["dmm"].extend([dmm_i])
-            print(f"set: {i}, DMM: {dmm_i:7.5f}, SMU: {smu_i:7.5f}")
+        function = "current"
+        column = 1
+        polarity = -1
+
+    # set dmm function
+    dmm.set_function(function, "dc")
+    if function == "voltage":
+        dmm.set_dc_voltage_measurement_impedance("10G")
+    dmm.set_reading_rate(function, "dc", "S")
+
+    # set smu output, starting from zero if enabled
+    if smu_mode is None:
+        smu.enable_output(False, channel)
+    else:
+        smu.configure_dc({channel: 0}, source_mode=smu_mode)
+        smu.enable_output(True, channel)
 
-        psu.set_apply(channel=1, voltage=max_voltage, current=0)
-        input(
-            "\nReverse the polarity of the PSU CH1 outputs. Press Enter when ready...\n"
-        )
+    # set psu to source zero and enable output
+    if psu_sources is True:
+        set_psu(function, 0)
+        psu.set_output_enable(True, 1)
 
-        for i in cal_currents_1:
-            psu.set_apply(channel=1, voltage=max_voltage, current=float(i))
+    # measure
+    if psu_sources is True:
+        cal_ch = {"smu": [], "dmm": []}
+    else:
+        cal_ch = {"set": [], "smu": [], "dmm": []}
+    for segment, segment_set_points in enumerate(set_points):
+        if segment > 0:
+            set_psu(function, 0)
+            input(
+                "\nReverse the polarity of the PSU CH1 outputs. Press Enter when "
+                + "ready...\n"
+            )
+
+        for set_point in segment_set_points:
+            if psu_sources is True:
+                set_psu(function, set_point)
+            else:
+                smu.configure_dc({channel: set_point}, source_mode=smu_mode)
+
+            # wait for the new level to settle before the dmm reference reading
             time.sleep(args.delay)
 
-            # reverse polarity as SMU's are seeing opposites
-            [dmm.measure("current", "dc") for _ in range(dummys)]
-            dmm_is = [-dmm.measure("current", "dc") for _ in range(avs)]
-            dmm_i = sum(dmm_is) / len(dmm_is)
-
-            smu_i = smu.measure(channel, measurement="dc")[channel][0][1]
-
-            f.write(f"<{dmm_i:6.4f}, {smu_i:7.5f}>\n")
-
-            cal_ch_meas_i["smu"].extend([smu_i])
-            cal_ch_meas_i["dmm"].extend([dmm_i])
-            print(f"set: {i}, DMM: {dmm_i:7.5f}, SMU: {smu_i:7.5f}")
-
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["meas_i"] = cal_ch_meas_i
+            # measure with the smu in the background while the dmm reads
+            smu_future = smu_executor.submit(smu.measure, channel, measurement="dc")
+            dmm_value = polarity * read_dmm(function)
+            smu_value = smu_future.result()[channel][0][column]
+
+            if psu_sources is False:
+                cal_ch["set"].append(set_point)
+            cal_ch["smu"].append(smu_value)
+            cal_ch["dmm"].append(dmm_value)
+            print(f"set: {set_point}, DMM: {dmm_value:7.5f}, SMU: {smu_value:7.5f}")
+
+    # save the section in the order required by the cal file
+    if psu_sources is True:
+        columns = (cal_ch["dmm"], cal_ch["smu"])
+        fmt = "<%6.4f, %7.5f>"
+    else:
+        columns = (cal_ch["smu"], cal_ch["dmm"])
+        fmt = "<%7.5f, %6.4f>"
+    f.write(f"# Channel {channel}, {label}\n</>\n")
+    np.savetxt(f, np.column_stack(columns), fmt=fmt)
+    f.write("<\>\n\n")
+    cal_dict[dev_channel][key] = cal_ch
 
     # turn off instrument outputs
     smu.enable_output(False, channel)
-    psu.set_apply(channel=1, voltage=max_voltage, current=0)
-    psu.set_output_enable(False, 1)
+    if psu_sources is True:
+        set_psu(function, 0)
+        psu.set_output_enable(False, 1)
 
-    print(f"CH{channel + 1} measure current calibration measurement complete!")
+    print(f"CH{channel + 1} {label} calibration measurement complete!")
 
 
-def source_voltage_cal(smu, channel, save_file):
-    """Perform measurement for voltage source calibration of an ADALM100 channel.
+def measure_voltage_cal(smu, channel, f):
+    """Perform measurement for voltage measurement calibration of an ADALM100 channel.
 
     Parameters
     ----------
@@ -386,63 +428,48 @@ def source_voltage_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
     """
-    global cal_dict
-
-    print(f"\nPerforming CH{channel + 1} source voltage calibration measurement...")
-
-    # get smu sub-channel letter
-    dev_channel = smu.channel_settings[channel]["dev_channel"]
-
-    # set dmm to measure voltage
-    dmm.set_function("voltage", "dc")
-    dmm.set_dc_voltage_measurement_impedance("10G")
-    dmm.set_reading_rate("voltage", "dc", "S")
-
-    # set smu to source voltage, measure current and set voltage to 0
-    smu.configure_dc({channel: 0}, source_mode="v")
-    smu.enable_output(True, channel)
-
-    if save_file.exists() is True:
-        write_mode = "a"
-    else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, source V\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_sour_v = {"set": [], "smu": [], "dmm": []}
-        for v in cal_voltages_source:
-            smu.configure_dc({channel: float(v)}, source_mode="v")
-            time.sleep(args.delay)
-
-            [dmm.measure("voltage", "dc") for _ in range(dummys)]
-            dmm_vs = [dmm.measure("voltage", "dc") for _ in range(avs)]
-            dmm_v = sum(dmm_vs) / len(dmm_vs)
+    # PSU sources voltage, SMU measures in high impedance mode
+    run_cal(smu, channel, f, "measure V", "meas_v", None, [cal_voltages_meas])
 
-            smu_v = smu.measure(channel, measurement="dc")[channel][0][0]
 
-            f.write(f"<{smu_v:7.5f}, {dmm_v:6.4f}>\n")
+def measure_current_cal(smu, channel, f):
+    """Perform measurement for current measurement calibration of an ADALM100 channel.
 
-            cal_ch_sour_v["set"].extend([float(v)])
-            cal_ch_sour_v["smu"].extend([smu_v])
-            cal_ch_sour_v["dmm"].extend([dmm_v])
-            print(f"set: {v}, SMU: {smu_v:7.5f}, DMM: {dmm_v:7.5f}")
+    Parameters
+    ----------
+    smu : m1k.smu
+        SMU object.
+    channel : int
+        SMU channel number.
+    f : file object
+        Open save file formatted for internal calibration.
+    """
+    # PSU sources current in each polarity, SMU sources 0 V and measures current
+    run_cal(
+        smu, channel, f, "measure I", "meas_i", "v", [cal_currents_0, cal_currents_1]
+    )
 
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["source_v"] = cal_ch_sour_v
 
-    # turn off smu outputs
-    smu.enable_output(False, channel)
+def source_voltage_cal(smu, channel, f):
+    """Perform measurement for voltage source calibration of an ADALM100 channel.
 
-    print(f"CH{channel + 1} source voltage calibration measurement complete!")
+    Parameters
+    ----------
+    smu : m1k.smu
+        SMU object.
+    channel : int
+        SMU channel number.
+    f : file object
+        Open save file formatted for internal calibration.
+    """
+    # SMU sources voltage, DMM measures voltage
+    run_cal(smu, channel, f, "source V", "source_v", "v", [cal_voltages_source])
 
 
-def source_current_cal(smu, channel, save_file):
+def source_current_cal(smu, channel, f):
     """Perform measurement for current source calibration of an ADALM100 channel.
 
     Parameters
@@ -451,63 +478,14 @@ def source_current_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
     """
-    global cal_dict
-
-    print(f"\nPerforming CH{channel + 1} source current calibration measurement...")
-
-    # get smu sub-channel letter
-    dev_channel = smu.channel_settings[channel]["dev_channel"]
-
-    # set dmm to measure current
-    dmm.set_function("current", "dc")
-    dmm.set_reading_rate("current", "dc", "S")
-
-    # set smu to source current, measure voltage and set current to 0
-    smu.configure_dc({channel: 0}, source_mode="i")
-    smu.enable_output(True, channel)
-
-    if save_file.exists() is True:
-        write_mode = "a"
-    else:
-        write_mode = "w"
-
-    # measure and save
-    with open(save_file, write_mode) as f:
-        f.write(f"# Channel {channel}, source I\n")
-        f.write("</>\n")
-        # run through the list of voltages
-        cal_ch_sour_i = {"set": [], "smu": [], "dmm": []}
-        for i in cal_currents_source:
-            smu.configure_dc({channel: float(i)}, source_mode="i")
-            time.sleep(args.delay)
-
-            # reverse polarity as SMU's are seeing opposites
-            [dmm.measure("current", "dc") for _ in range(dummys)]
-            dmm_is = [-dmm.measure("current", "dc") for _ in range(avs)]
-            dmm_i = sum(dmm_is) / len(dmm_is)
-
-            smu_i = smu.measure(channel, measurement="dc")[channel][0][1]
-
-            f.write(f"<{smu_i:7.5f}, {dmm_i:6.4f}>\n")
+    # SMU sources current, DMM measures current
+    run_cal(smu, channel, f, "source I", "source_i", "i", [cal_currents_source])
 
-            cal_ch_sour_i["set"].extend([float(i)])
-            cal_ch_sour_i["smu"].extend([smu_i])
-            cal_ch_sour_i["dmm"].extend([dmm_i])
-            print(f"set: {i}, SMU: {smu_i:7.5f}, DMM: {dmm_i:7.5f}")
 
-        f.write("<\>\n\n")
-        cal_dict[dev_channel]["source_i"] = cal_ch_sour_i
-
-    # turn off smu outputs
-    smu.enable_output(False, channel)
-
-    print(f"CH{channel + 1} source voltage calibration measurement complete!")
-
-
-def channel_cal(smu, channel, save_file):
+def channel_cal(smu, channel, f):
     """Run all calibration measurements for a channel.
 
     Parameters
@@ -516,36 +494,54 @@ def channel_cal(smu, channel, save_file):
         SMU object.
     channel : int
         SMU channel number.
-    save_file : str or pathlib.Path
-        Path to save file formatted for internal calibration.
+    f : file object
+        Open save file formatted for internal calibration.
     """
     input(
         f"\nConnect PSU CH1 HI and DMM HI to SMU CH {channel + 1} HI, and PSU "
         + f"CH1 LO and DMM LO to SMU CH {channel + 1} LO. Press Enter when "
         + "ready..."
     )
-    measure_voltage_cal(smu, channel, save_file)
+    measure_voltage_cal(smu, channel, f)
 
     input(
         f"\nConnect DMM HI to SMU CH {channel + 1} HI, and DMM LO to SMU CH "
         + f"{channel + 1} LO. Press Enter when ready..."
     )
-    source_voltage_cal(smu, channel, save_file)
+    source_voltage_cal(smu, channel, f)
 
     input(
         f"\nConnect PSU CH1 HI to DMM current HI, DMM LO to SMU CH {channel + 1}"
         + f" HI, and PSU CH1 LO to SMU CH {channel + 1} LO. Press Enter when "
         + "ready..."
     )
-    measure_current_cal(smu, channel, save_file)
+    measure_current_cal(smu, channel, f)
 
     if args.simv is True:
         input(
             f"\nConnect DMM current HI to SMU CH {channel + 1} HI and DMM LO to "
             + f"SMU CH {channel + 1} 2.5 V. Press Enter when ready..."
         )
-        source_current_cal(smu, channel, save_file)
+        source_current_cal(smu, channel, f)
+
 
+def save_cal_dict(cal_dict, save_file_dict):
+    """Export a calibration dictionary to a yaml file.
+
+    Parameters
+    ----------
+    cal_dict : dict
+        Calibration dictionary.
+    save_file_dict : pathlib.Path
+        Path to yaml file.
+    """
+    with open(save_file_dict, "w") as f:
+        yaml.dump(cal_dict, f, Dumper=SafeDumper)
+
+
+# worker thread for saving calibration dictionaries while the next board is set up
+writer_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+writer_futures = []
 
 # perform calibration measurements in exact order required for cal file
 t = time.time()
@@ -569,13 +565,22 @@ for board in range(smu.num_boards):
         channel_A_num = 2 * board
         channel_B_num = 2 * board + 1
 
-        # run calibrations
-        channel_cal(smu, channel_A_num, save_file)
-        channel_cal(smu, channel_B_num, save_file)
+        # run calibrations, keeping the save file open for all of them
+        with open(save_file, "w", encoding="ascii") as f:
+            channel_cal(smu, channel_A_num, f)
+            channel_cal(smu, channel_B_num, f)
+
+        # export calibration dictionary to a yaml file in the background
+        writer_futures.append(
+            writer_executor.submit(save_cal_dict, cal_dict, save_file_dict)
+        )
+
+smu_executor.shutdown()
 
-        # export calibration dictionary to a yaml file
-        with open(save_file_dict, "w") as f:
-            yaml.dump(cal_dict, f)
+# wait for all files to be written, re-raising any errors
+for future in writer_futures:
+    future.result()
+writer_executor.shutdown()
 
 smu.set_leds(R=True)
 
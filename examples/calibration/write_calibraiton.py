@@ -29,7 +29,7 @@ m1kchB.mode = pysmu.Mode.HI_Z
 m1k.set_led(2)
 print("Connected!")
 
-m1k.write_calibraiton(str(calibration_file))
+m1k.write_calibration(str(calibration_file))
 
 print(
     "\nNew calibration was written to the device! Power cycle the device to "
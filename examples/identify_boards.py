@@ -3,7 +3,7 @@
 import pathlib
 import sys
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.joinpath("src")))
+sys.path.insert(1, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("src")))
 import m1k.m1k as m1k
 
 
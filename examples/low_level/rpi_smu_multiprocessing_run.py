@@ -1,14 +1,11 @@
 import multiprocessing
+import queue
 import time
 
 import pysmu
 
-# create session
-s = pysmu.Session()
-print(f"Number of devices: {len(s.devices)}\n")
 
-
-def write_all(v):
+def write_all(s, v):
     for dev in s.devices:
         dev.channels["A"].write([v], cyclic=False)
 
@@ -16,56 +13,82 @@ def write_all(v):
         dev.channels["A"].mode = pysmu.Mode.SVMI
 
 
-def run(s, n):
-    s.run(n)
-
+def worker(cmd_q, result_q):
+    # create session once and keep it for all runs
+    s = pysmu.Session()
+    print(f"Number of devices: {len(s.devices)}\n")
 
-if __name__ == "__main__":
     # write voltage
     t0 = time.time()
-    write_all(0)
+    write_all(s, 0)
     t1 = time.time()
     print(f"write time: {t1-t0}s\n")
 
+    # run captures on request until told to stop
+    while True:
+        n = cmd_q.get()
+        if n is None:
+            break
+
+        s.run(n)
+
+        t4 = time.time()
+        data = s.read(n)
+        t5 = time.time()
+        print(f"read time: {t5-t4}\n")
+        result_q.put([len(d) for d in data])
+
+
+def start_worker(cmd_q, result_q):
+    p = multiprocessing.Process(target=worker, args=(cmd_q, result_q))
+    p.start()
+    return p
+
+
+if __name__ == "__main__":
+    # start worker that owns the session
+    cmd_q = multiprocessing.Queue()
+    result_q = multiprocessing.Queue()
+    p = start_worker(cmd_q, result_q)
+
     # number of samples
     n = 100000
 
     # run capture
     failed = True
+    respawned = False
     i = 0
     while (failed is True) or (i < 3):
         print(f"Run attempt {i}...")
         t2 = time.time()
 
-        p = multiprocessing.Process(
-            target=run,
-            args=(
-                s,
-                n,
-            ),
-        )
-        p.start()
-
-        # 5s timeout for run process
-        p.join(5)
+        cmd_q.put(n)
 
-        # if timeout occurs terminate process and try again
-        if p.is_alive():
+        # 5s timeout for run
+        try:
+            lengths = result_q.get(timeout=5)
+            print("...run succeeded!\n")
+            print(len(lengths), lengths)
+            failed = False
+        except queue.Empty:
             print("...run failed!\n")
 
+            # if timeout occurs terminate worker and try again with a new one, but
+            # only once
             p.terminate()
             p.join()
-        else:
-            print("...run succeeded!\n")
-            failed = False
+            if respawned is True:
+                raise RuntimeError("Run timed out again after restarting worker.")
+            cmd_q = multiprocessing.Queue()
+            result_q = multiprocessing.Queue()
+            p = start_worker(cmd_q, result_q)
+            respawned = True
 
         t3 = time.time()
         print(f"run time: {t3-t2}s\n")
 
         i += 1
 
-    t4 = time.time()
-    data = s.read(n)
-    t5 = time.time()
-    print(f"read time: {t5-t4}\n")
-    print(len(data), [len(d) for d in data])
+    # stop worker
+    cmd_q.put(None)
+    p.join()
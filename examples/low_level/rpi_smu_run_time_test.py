@@ -7,10 +7,11 @@ import pysmu
 s = pysmu.Session()
 
 
-def write_all(vs, retries=3):
+def write_all(v, retries=3):
+    # a single cyclic sample holds the output at v for any run length
     for dev in s.devices:
-        dev.channels["A"].write(vs, cyclic=False)
-        dev.channels["B"].write(vs, cyclic=False)
+        dev.channels["A"].write([v], cyclic=True)
+        dev.channels["B"].write([v], cyclic=True)
 
     attempt = 0
     for _ in range(retries):
@@ -43,7 +44,7 @@ if __name__ == "__main__":
         attempt = 0
         for _ in range(retries):
             t0 = time.time()
-            write_all([v] * n, retries)
+            write_all(v, retries)
             t1 = time.time()
             print(f"write time: {t1-t0} s")
             print(f"Run attempt {attempt}")
@@ -1,13 +1,15 @@
 """Example using the m1k library to perform max power point tracking on all channels."""
 
-import time
+import math
 import pathlib
+import random
 import sys
+import time
 
 import matplotlib.pyplot as plt
 import numpy as np
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.joinpath("src")))
+sys.path.insert(1, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("src")))
 import m1k.m1k as m1k
 
 
@@ -29,10 +31,15 @@ def mppt(smu, v_start=0.3, a=1, delay=0.5, t_end=30):
 
     Returns
     -------
-    data : list of tuples
-        Maximum power point tracking data.
+    data : dict of numpy.ndarray
+        Maximum power point tracking data for each channel with rows of (voltage,
+        current, time, status).
     """
 
+    # min and max voltage steps
+    v_min = 0.002
+    v_max = 0.2
+
     def calc_new_voltage(v_lat, v_old, p_lat, p_old, a):
         """Calculate next voltage for maximum power point tracker.
 
@@ -60,71 +67,75 @@ def mppt(smu, v_start=0.3, a=1, delay=0.5, t_end=30):
 
         v_step = a * dpdv
 
-        v_min = 0.002
-        v_max = 0.2
-
-        # coerce min step
-        if np.absolute(v_step) < v_min:
-            v_step = np.sign(np.random.rand() - 0.5) * v_min
-
-        # coerce max step
-        if np.absolute(v_step) > v_max:
-            v_step = v_max * np.sign(v_step)
+        # coerce min step in a random direction, or coerce max step. These are
+        # scalars so use builtins rather than paying numpy's per-call overhead.
+        if abs(v_step) < v_min:
+            v_step = math.copysign(v_min, random.random() - 0.5)
+        elif abs(v_step) > v_max:
+            v_step = math.copysign(v_max, v_step)
 
         v_new = v_old - v_step
 
         return v_new
 
-    # init container
+    # preallocate one container for all channels with the most points that can fit
+    # in the tracking time, including the two initial points
+    max_points = int(t_end // delay) + 3
     num_channels = smu.num_channels
-    mppt_data = {}
-    for ch in range(num_channels):
-        mppt_data[ch] = []
-
-    # init tracker
-    v_starts = {}
-    for ch in range(num_channels):
-        v_starts[ch] = v_start
-    smu.configure_dc(v_starts)
+    samples = np.empty((num_channels, max_points, 4))
+
+    def update_voltages(i):
+        """Calculate the next voltage for all channels from points i - 1 and i.
+
+        Parameters
+        ----------
+        i : int
+            Index of latest point.
+        """
+        # gather voltages and powers for all channels at once, as native floats for
+        # the scalar step calculation
+        v_olds = samples[:, i - 1, 0]
+        v_lats = samples[:, i, 0]
+        p_olds = (v_olds * samples[:, i - 1, 1]).tolist()
+        p_lats = (v_lats * samples[:, i, 1]).tolist()
+        for ch, (v_old, v_lat, p_old, p_lat) in enumerate(
+            zip(v_olds.tolist(), v_lats.tolist(), p_olds, p_lats)
+        ):
+            v_news[ch] = calc_new_voltage(v_lat, v_old, p_lat, p_old, a)
+
+    # init tracker, a single value applies to all channels
+    smu.configure_dc(v_start)
     point_data = smu.measure(measurement="dc")
     for ch, ch_data in point_data.items():
-        mppt_data[ch].extend(ch_data)
+        samples[ch, 0] = ch_data[0]
 
-    v_nexts = {}
-    for ch in range(num_channels):
-        v_nexts[ch] = v_start + 0.001
-    smu.configure_dc(v_nexts)
+    smu.configure_dc(v_start + 0.001)
     point_data = smu.measure(measurement="dc")
     for ch, ch_data in point_data.items():
-        mppt_data[ch].extend(ch_data)
+        samples[ch, 1] = ch_data[0]
 
+    # new voltages for each channel, updated in place every iteration
     v_news = {}
-    for ch, ch_data in mppt_data.items():
-        v_old = ch_data[0][0]
-        v_lat = ch_data[1][0]
-        p_old = ch_data[0][0] * ch_data[0][1]
-        p_lat = ch_data[1][0] * ch_data[1][1]
-        v_news[ch] = calc_new_voltage(v_lat, v_old, p_lat, p_old, a)
+    update_voltages(1)
 
     # continue mppt
     i = 2
-    t_start = time.time()
-    while time.time() - t_start < t_end:
+    t_start = time.monotonic()
+    while (time.monotonic() - t_start < t_end) and (i < max_points):
+        # let the device settle at the new voltage until the next point is due, so
+        # the sample times don't drift
         smu.configure_dc(v_news)
+        time.sleep(max(0, t_start + (i - 1) * delay - time.monotonic()))
         point_data = smu.measure(measurement="dc")
         for ch, ch_data in point_data.items():
-            mppt_data[ch].extend(ch_data)
-
-        v_news = {}
-        for ch, ch_data in mppt_data.items():
-            v_old = ch_data[i - 1][0]
-            v_lat = ch_data[i][0]
-            p_old = ch_data[i - 1][0] * ch_data[i - 1][1]
-            p_lat = ch_data[i][0] * ch_data[i][1]
-            v_news[ch] = calc_new_voltage(v_lat, v_old, p_lat, p_old, a)
+            samples[ch, i] = ch_data[0]
+
+        update_voltages(i)
 
         i += 1
-        time.sleep(delay)
+
+    # split into channels, trimming unused rows
+    mppt_data = {ch: samples[ch, :i] for ch in range(num_channels)}
 
     return mppt_data
 
@@ -158,19 +169,34 @@ fig, ax = plt.subplots(1, 3)
 ax1, ax2, ax3 = ax
 
 for ch, ch_data in mppt_data.items():
-    voltages = []
-    currents = []
-    times = []
-    powers = []
-    t0 = ch_data[0][2]
-    for v, i, t, s in ch_data:
-        voltages.append(abs(v))
-        currents.append(abs(i * 1000))
-        times.append(t - t0)
-        powers.append(abs(v * i * 1000))
-    ax1.scatter(times, voltages, label=f"channel {ch}")
-    ax2.scatter(times, currents, label=f"channel {ch}")
-    ax3.scatter(times, powers, label=f"channel {ch}")
+    voltages = np.absolute(ch_data[:, 0])
+    currents = np.absolute(ch_data[:, 1]) * 1000
+    times = ch_data[:, 2] - ch_data[0, 2]
+    powers = voltages * currents
+    ax1.plot(
+        times,
+        voltages,
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"channel {ch}",
+    )
+    ax2.plot(
+        times,
+        currents,
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"channel {ch}",
+    )
+    ax3.plot(
+        times,
+        powers,
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"channel {ch}",
+    )
 
 ax1.tick_params(direction="in", top=True, right=True, labelsize="large")
 ax1.set_xlabel("Time (s)", fontsize="large")
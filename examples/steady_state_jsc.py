@@ -5,8 +5,9 @@ import time
 import sys
 
 import matplotlib.pyplot as plt
+import numpy as np
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.joinpath("src")))
+sys.path.insert(1, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("src")))
 import m1k.m1k as m1k
 
 
@@ -22,23 +23,31 @@ def steady_state_jsc(smu, delay=0.5, t_end=30):
 
     Returns
     -------
-    data : list of tuples
-        Steady-state Voc data.
+    data : dict of numpy.ndarray
+        Steady-state Jsc data for each channel with rows of (voltage, current,
+        time, status).
     """
-    # init container
+    # preallocate containers for the most points that can fit in the measurement
+    # time
+    max_points = int(t_end // delay) + 1
     num_channels = smu.num_channels
-    jsc_data = {}
-    for ch in range(num_channels):
-        jsc_data[ch] = []
+    jsc_data = {ch: np.empty((max_points, 4)) for ch in range(num_channels)}
 
     # run steady-state jsc
-    t_start = time.time()
-    while time.time() - t_start < t_end:
+    t_start = time.monotonic()
+    point = 0
+    while (time.monotonic() - t_start < t_end) and (point < max_points):
         point_data = smu.measure(measurement="dc")
         for ch, ch_data in point_data.items():
-            jsc_data[ch].extend(ch_data)
+            jsc_data[ch][point] = ch_data[0]
+        point += 1
+
+        # wait until the next point is due so the sample times don't drift
+        time.sleep(max(0, t_start + point * delay - time.monotonic()))
 
-        time.sleep(delay)
+    # trim unused rows
+    for ch in range(num_channels):
+        jsc_data[ch] = jsc_data[ch][:point]
 
     return jsc_data
 
@@ -71,14 +80,17 @@ fig, ax = plt.subplots()
 
 max_jscs = []
 for ch, ch_data in jsc_data.items():
-    currents = []
-    times = []
-    t0 = ch_data[0][2]
-    for v, i, t, s in ch_data:
-        currents.append(abs(i) * 1000)
-        times.append(t - t0)
-    ax.scatter(times, currents, label=f"channel {ch}")
-    max_jscs.append(max(currents))
+    currents = np.absolute(ch_data[:, 1]) * 1000
+    times = ch_data[:, 2] - ch_data[0, 2]
+    ax.plot(
+        times,
+        currents,
+        linestyle="",
+        marker=".",
+        rasterized=True,
+        label=f"channel {ch}",
+    )
+    max_jscs.append(currents.max())
 
 ax.tick_params(direction="in", top=True, right=True, labelsize="large")
 ax.set_xlabel("Time (s)", fontsize="large")
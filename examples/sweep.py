@@ -1,13 +1,13 @@
 """Example using the m1k library to perform voltage sweeps on all connected devices."""
 
-import csv
 import pathlib
 import time
 import sys
 
 import matplotlib.pyplot as plt
+import numpy as np
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.joinpath("src")))
+sys.path.insert(1, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("src")))
 import m1k.m1k as m1k
 
 
@@ -37,8 +37,9 @@ with m1k.smu() as smu:
 # plot the data
 fig, ax = plt.subplots()
 for ch, ch_data in data.items():
-    voltages = [v for v, i, t, s in ch_data]
-    currents = [i * 1000 for v, i, t, s in ch_data]
+    ch_data = np.asarray(ch_data, dtype=float)
+    voltages = ch_data[:, 0]
+    currents = ch_data[:, 1] * 1000
     ax.scatter(voltages, currents, label=f"channel {ch}")
 ax.axhline(0, lw=0.5, c="black")
 ax.tick_params(direction="in", top=True, right=True, labelsize="large")
@@ -51,7 +52,10 @@ plt.show()
 data_folder = pathlib.Path("data")
 save_file = data_folder.joinpath(f"sweep_{int(time.time())}.tsv")
 
-with open(save_file, "w", newline="\n") as f:
-    writer = csv.writer(f, delimiter="\t")
-    for row in data[0]:
-        writer.writerow(row)
+# tab-separated rows of voltage, current, time, and status
+np.savetxt(
+    save_file,
+    np.asarray(data[0], dtype=float),
+    fmt=["%.6e", "%.6e", "%.6f", "%d"],
+    delimiter="\t",
+)
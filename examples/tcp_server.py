@@ -1,23 +1,29 @@
 """TCP server for SMU."""
 
 import ast
+import concurrent.futures
 import logging
+import math
 import os
 import pathlib
 import socket
+import threading
 import warnings
 import sys
 
 import yaml
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.joinpath("src")))
+sys.path.insert(1, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("src")))
 import m1k.m1k as m1k
+from m1k.yaml_utils import SafeLoader, SafeDumper
 
 HOST = "0.0.0.0"  # server listens on all interfaces
 PORT = 20101
 TERMCHAR = "\n"
 TERMCHAR_BYTES = TERMCHAR.encode()
 COMMS_TIMEOUT = 10  # in seconds
+ACCEPT_TIMEOUT = 1  # in seconds, how often the server checks for a shutdown
+MAX_WORKERS = 8  # maximum number of connections serviced at once
 CACHE_PATH = pathlib.Path("cache.yaml")
 
 # set up logger
@@ -60,6 +66,321 @@ def stringify_nonnative_dict_values(d):
     return d
 
 
+INVALID = "ERROR: invalid message."
+
+
+def query_handler(get):
+    """Create a handler for a command that only returns a value.
+
+    Parameters
+    ----------
+    get : callable
+        Function of the smu object returning the value to send.
+
+    Returns
+    -------
+    handler : callable
+        Command handler.
+    """
+
+    def handler(smu, args):
+        if len(args) == 0:
+            return str(get(smu))
+        else:
+            return INVALID
+
+    return handler
+
+
+def get_set_handler(attr, cast):
+    """Create a handler for a command that gets or sets an smu attribute.
+
+    Parameters
+    ----------
+    attr : str
+        Name of the smu attribute.
+    cast : callable
+        Function converting the message argument to the attribute's type.
+
+    Returns
+    -------
+    handler : callable
+        Command handler.
+    """
+
+    def handler(smu, args):
+        if len(args) == 0:
+            return str(getattr(smu, attr))
+        elif len(args) == 1:
+            setattr(smu, attr, cast(args[0]))
+            return ""
+        else:
+            return INVALID
+
+    return handler
+
+
+def channel_setting_handler(kw, cast):
+    """Create a handler for a command that configures a channel setting.
+
+    Parameters
+    ----------
+    kw : str
+        Keyword argument of `smu.configure_channel_settings`.
+    cast : callable
+        Function converting the message argument to the setting's type.
+
+    Returns
+    -------
+    handler : callable
+        Command handler.
+    """
+
+    def handler(smu, args):
+        if len(args) == 2:
+            smu.configure_channel_settings(
+                channel=parse_literal(args[1]), **{kw: cast(args[0])}
+            )
+            return ""
+        else:
+            return INVALID
+
+    return handler
+
+
+def parse_number(arg):
+    """Convert a message argument to an int or float.
+
+    Only accepts what `ast.literal_eval` would parse as a number, so non-finite
+    values like "nan" and "inf", and underscore separators, are rejected.
+
+    Parameters
+    ----------
+    arg : str
+        Message argument.
+
+    Returns
+    -------
+    value : int or float
+        Parsed number.
+
+    Raises
+    ------
+    ValueError
+        If the argument isn't a finite int or float literal.
+    """
+    if "_" in arg:
+        raise ValueError(f"Not a plain number: {arg}")
+
+    try:
+        return int(arg)
+    except ValueError:
+        value = float(arg)
+
+    if math.isfinite(value) is False:
+        raise ValueError(f"Not a finite number: {arg}")
+
+    return value
+
+
+def parse_literal(arg):
+    """Convert a message argument to a Python literal.
+
+    Numbers, `None`, and flat lists of numbers are by far the most common arguments
+    so parse them directly. Anything else, e.g. a dictionary, falls back to
+    `ast.literal_eval`, which is much slower.
+
+    Parameters
+    ----------
+    arg : str
+        Message argument.
+
+    Returns
+    -------
+    value : object
+        Parsed literal.
+    """
+    if arg == "None":
+        return None
+
+    try:
+        if arg.startswith("[") and arg.endswith("]"):
+            items = arg[1:-1]
+            if items == "":
+                return []
+            else:
+                return [parse_number(item) for item in items.split(",")]
+        else:
+            return parse_number(arg)
+    except ValueError:
+        return ast.literal_eval(arg)
+
+
+def to_bool(arg):
+    """Convert a message argument of "0" or "1" to a bool."""
+    return bool(int(arg))
+
+
+def reset_handler(smu, args):
+    """Reset the SMU."""
+    if len(args) == 0:
+        smu.reset()
+        return ""
+    else:
+        return INVALID
+
+
+def idn_handler(smu, args):
+    """Get the server or a channel's ID."""
+    if len(args) == 0:
+        return idn
+    elif len(args) == 1:
+        return smu.get_channel_id(int(args[0]))
+    else:
+        return INVALID
+
+
+def invert_handler(smu, args):
+    """Get or set whether channels are inverted."""
+    if len(args) == 0:
+        return str(smu.channels_inverted)
+    elif len(args) == 1:
+        smu.invert_channels(to_bool(args[0]))
+        return ""
+    else:
+        return INVALID
+
+
+def cal_handler(smu, args):
+    """Switch channels to external or internal calibration."""
+    if len(args) != 2:
+        return INVALID
+
+    if args[0] == "ext":
+        if cal_data == {}:
+            return "ERROR: external calibration data not available."
+        elif parse_literal(args[1]) is None:
+            for ch, data in cal_data.items():
+                smu.use_external_calibration(ch, data)
+        else:
+            smu.use_external_calibration(int(args[1]), cal_data[int(args[1])])
+    elif args[0] == "int":
+        smu.use_internal_calibration(parse_literal(args[1]))
+
+    return ""
+
+
+def sweep_handler(smu, args):
+    """Configure a linear sweep."""
+    if len(args) == 4:
+        smu.configure_sweep(float(args[0]), float(args[1]), int(args[2]), args[3])
+        return ""
+    else:
+        return INVALID
+
+
+def list_sweep_handler(smu, args):
+    """Configure a list sweep."""
+    if len(args) == 2:
+        smu.configure_list_sweep(parse_literal(args[0]), args[1])
+        return ""
+    else:
+        return INVALID
+
+
+def dc_handler(smu, args):
+    """Configure DC outputs."""
+    if len(args) == 2:
+        smu.configure_dc(parse_literal(args[0]), args[1])
+        return ""
+    else:
+        return INVALID
+
+
+def measure_handler(smu, args):
+    """Run a measurement and return the data."""
+    if len(args) == 3:
+        data = smu.measure(parse_literal(args[0]), args[1], to_bool(args[2]))
+        return str(data)
+    else:
+        return INVALID
+
+
+def enable_output_handler(smu, args):
+    """Enable or disable outputs."""
+    if len(args) == 2:
+        smu.enable_output(to_bool(args[0]), parse_literal(args[1]))
+        return ""
+    else:
+        return INVALID
+
+
+def led_handler(smu, args):
+    """Set channel LEDs."""
+    if len(args) == 4:
+        smu.set_leds(
+            parse_literal(args[3]),
+            to_bool(args[0]),
+            to_bool(args[1]),
+            to_bool(args[2]),
+        )
+        return ""
+    else:
+        return INVALID
+
+
+def low_level_voltage_sweep_handler(smu, args):
+    """Run a low level voltage sweep and return the data."""
+    if len(args) == 3:
+        data = smu._low_level_voltage_sweep(
+            float(args[0]), float(args[1]), int(args[2])
+        )
+        return str(data)
+    else:
+        return INVALID
+
+
+# the smu hardware can only do one thing at a time so handlers must hold this lock
+smu_lock = threading.Lock()
+
+# set when servicing a request fails, after which no more requests are serviced
+shutdown = threading.Event()
+
+# map command names to handlers. Each handler takes the smu object and a list of the
+# message arguments, and returns the response string.
+HANDLERS = {
+    "plf": get_set_handler("plf", float),
+    "cpb": query_handler(lambda smu: smu.ch_per_board),
+    "rst": reset_handler,
+    "buf": query_handler(lambda smu: smu.maximum_buffer_size),
+    "chs": query_handler(lambda smu: smu.num_channels),
+    "bds": query_handler(lambda smu: smu.num_boards),
+    "sr": query_handler(lambda smu: smu.sample_rate),
+    "set": query_handler(
+        lambda smu: stringify_nonnative_dict_values(smu.channel_settings)
+    ),
+    "nplc": get_set_handler("nplc", float),
+    "sd": get_set_handler("settling_delay", float),
+    "eos": query_handler(lambda smu: smu.enabled_outputs),
+    "idn": idn_handler,
+    "ovc": query_handler(lambda smu: smu.overcurrent),
+    "chm": query_handler(lambda smu: smu.channel_mapping),
+    "inv": invert_handler,
+    "rstc": query_handler(lambda smu: smu._reset_cache),
+    "cal": cal_handler,
+    "fw": channel_setting_handler("four_wire", to_bool),
+    "vr": channel_setting_handler("v_range", float),
+    "def": channel_setting_handler("default", to_bool),
+    "swe": sweep_handler,
+    "lst": list_sweep_handler,
+    "dc": dc_handler,
+    "meas": measure_handler,
+    "eo": enable_output_handler,
+    "led": led_handler,
+    "llvs": low_level_voltage_sweep_handler,
+}
+
+
 def worker(smu, conn):
     """Handle messages.
 
@@ -69,8 +390,6 @@ def worker(smu, conn):
         SMU object.
     conn : socket connection
         Socket object usable to send and receive data on the connection.
-    addr : socket address
-        Address bound to the socket on the other end of the connection.
     """
     conn.settimeout(COMMS_TIMEOUT)
 
@@ -83,166 +402,22 @@ def worker(smu, conn):
         msg_split = msg.split(" ")
 
         # handle message
-        resp = ""
-        if msg_split[0] == "plf":
-            if len(msg_split) == 1:
-                resp = str(smu.plf)
-            elif len(msg_split) == 2:
-                smu.plf = float(msg_split[1])
-            else:
-                resp = "ERROR: invalid message."
-        elif msg == "cpb":
-            resp = str(smu.ch_per_board)
-        elif msg == "rst":
-            smu.reset()
-        elif msg == "buf":
-            resp = str(smu.maximum_buffer_size)
-        elif msg == "chs":
-            resp = str(smu.num_channels)
-        elif msg == "bds":
-            resp = str(smu.num_boards)
-        elif msg == "sr":
-            resp = str(smu.sample_rate)
-        elif msg == "set":
-            resp = str(stringify_nonnative_dict_values(smu.channel_settings))
-        elif msg_split[0] == "nplc":
-            if len(msg_split) == 1:
-                resp = str(smu.nplc)
-            elif len(msg_split) == 2:
-                smu.nplc = float(msg_split[1])
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "sd":
-            if len(msg_split) == 1:
-                resp = str(smu.settling_delay)
-            elif len(msg_split) == 2:
-                smu.settling_delay = float(msg_split[1])
-            else:
-                resp = "ERROR: invalid message."
-        elif msg == "eos":
-            resp = str(smu.enabled_outputs)
-        elif msg_split[0] == "idn":
-            if len(msg_split) == 1:
-                resp = idn
-            elif len(msg_split) == 2:
-                resp = smu.get_channel_id(int(msg_split[1]))
-            else:
-                resp = "ERROR: invalid message."
-        elif msg == "ovc":
-            resp = str(smu.overcurrent)
-        elif msg == "chm":
-            resp = str(smu.channel_mapping)
-        elif msg_split[0] == "inv":
-            if len(msg_split) == 1:
-                resp = smu.channels_inverted
-            elif len(msg_split) == 2:
-                smu.invert_channels(bool(int(msg_split[1])))
-            else:
-                resp = "ERROR: invalid message."
-        elif msg == "rstc":
-            resp = str(smu._reset_cache)
-        elif msg_split[0] == "cal":
-            if len(msg_split) == 3:
-                if msg_split[1] == "ext":
-                    if cal_data == {}:
-                        resp = "ERROR: external calibration data not available."
-                    elif ast.literal_eval(msg_split[2]) is None:
-                        for ch, data in cal_data.items():
-                            smu.use_external_calibration(ch, data)
-                    else:
-                        smu.use_external_calibration(
-                            int(msg_split[2]), cal_data[int(msg_split[2])]
-                        )
-                elif msg_split[1] == "int":
-                    smu.use_internal_calibration(ast.literal_eval(msg_split[2]))
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "fw":
-            if len(msg_split) == 3:
-                smu.configure_channel_settings(
-                    channel=ast.literal_eval(msg_split[2]),
-                    four_wire=bool(int(msg_split[1])),
-                )
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "vr":
-            if len(msg_split) == 3:
-                smu.configure_channel_settings(
-                    channel=ast.literal_eval(msg_split[2]),
-                    v_range=float(msg_split[1]),
-                )
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "def":
-            if len(msg_split) == 3:
-                smu.configure_channel_settings(
-                    channel=ast.literal_eval(msg_split[2]),
-                    default=bool(int(msg_split[1])),
-                )
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "swe":
-            if len(msg_split) == 5:
-                smu.configure_sweep(
-                    float(msg_split[1]),
-                    float(msg_split[2]),
-                    int(msg_split[3]),
-                    msg_split[4],
-                )
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "lst":
-            if len(msg_split) == 3:
-                smu.configure_list_sweep(
-                    ast.literal_eval(msg_split[1]),
-                    msg_split[2],
-                )
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "dc":
-            if len(msg_split) == 3:
-                smu.configure_dc(ast.literal_eval(msg_split[1]), msg_split[2])
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "meas":
-            if len(msg_split) == 4:
-                data = smu.measure(
-                    ast.literal_eval(msg_split[1]),
-                    msg_split[2],
-                    bool(int(msg_split[3])),
-                )
-                resp = str(data)
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "eo":
-            if len(msg_split) == 3:
-                smu.enable_output(
-                    bool(int(msg_split[1])), ast.literal_eval(msg_split[2])
-                )
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "led":
-            if len(msg_split) == 5:
-                smu.set_leds(
-                    ast.literal_eval(msg_split[4]),
-                    bool(int(msg_split[1])),
-                    bool(int(msg_split[2])),
-                    bool(int(msg_split[3])),
-                )
-            else:
-                resp = "ERROR: invalid message."
-        elif msg_split[0] == "llvs":
-            if len(msg_split) == 4:
-                data = smu._low_level_voltage_sweep(
-                    float(msg_split[1]),
-                    float(msg_split[2]),
-                    int(msg_split[3]),
-                )
-                resp = str(data)
-            else:
-                resp = "ERROR: invalid message."
+        try:
+            handler = HANDLERS[msg_split[0]]
+        except KeyError:
+            resp = INVALID
         else:
-            resp = "ERROR: invalid message."
+            with smu_lock:
+                if shutdown.is_set() is True:
+                    resp = "ERROR: server shutting down."
+                else:
+                    try:
+                        resp = handler(smu, msg_split[1:])
+                    except Exception:
+                        # stop other workers touching the smu before the lock is
+                        # released so the cache holds the state at the failure
+                        shutdown.set()
+                        raise
 
         # send response
         if msg_split[0] != "llvs":
@@ -252,12 +427,54 @@ def worker(smu, conn):
         conn.sendall(resp.encode() + TERMCHAR_BYTES)
 
 
+def dump_cache():
+    """Dump smu object attributes that are native types to the cache file.
+
+    The cache is read back to restore the smu state when the server is relaunched.
+    """
+    # build dictionary of smu object attributes that are native types
+    cache = {}
+    with smu_lock:
+        for name, value in smu.__dict__.items():
+            if type(value) in [str, int, float, list, dict, tuple, bool]:
+                if type(value) is dict:
+                    value = stringify_nonnative_dict_values(value)
+                cache[name] = value
+
+    # dump attributes to file to read back on relaunch
+    with open(CACHE_PATH, "w") as f:
+        yaml.dump(cache, f, Dumper=SafeDumper)
+
+
+# errors raised by workers, re-raised by the main thread once the server stops
+errors = []
+errors_lock = threading.Lock()
+
+
+def worker_done(future):
+    """Shut down the server and dump the cache if servicing a request failed.
+
+    Parameters
+    ----------
+    future : concurrent.futures.Future
+        Finished worker future.
+    """
+    error = future.exception()
+    if error is not None:
+        # only the first failure dumps the cache
+        with errors_lock:
+            first = len(errors) == 0
+            errors.append(error)
+        shutdown.set()
+        if first is True:
+            dump_cache()
+
 # load config file
 try:
     config_path = pathlib.Path(os.environ["SMU_CONFIG_PATH"])
     logger.info(f"Config path: {config_path}")
     with open(config_path, "r") as f:
-        config = yaml.load(f, Loader=yaml.SafeLoader)
+        config = yaml.load(f, Loader=SafeLoader)
 except KeyError:
     config = None
     warnings.warn(
@@ -328,7 +545,7 @@ if cal_data_folder is not None:
 
         # load cal data
         with open(cf, "r") as f:
-            data = yaml.load(f, Loader=yaml.SafeLoader)
+            data = yaml.load(f, Loader=SafeLoader)
 
         # add data to cal dict
         if smu.ch_per_board == 1:
@@ -346,7 +563,7 @@ if CACHE_PATH.exists() is True:
     try:
         # load cache
         with open(CACHE_PATH, "r") as f:
-            cache = yaml.load(f, Loader=yaml.SafeLoader)
+            cache = yaml.load(f, Loader=SafeLoader)
 
         # update attributes from loaded cache
         for name, value in cache.items():
@@ -365,17 +582,20 @@ if CACHE_PATH.exists() is True:
     # delete the cache
     CACHE_PATH.unlink()
 
-# start server
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+# start server, servicing connections on a pool of worker threads so slow clients
+# don't block each other
+with socket.socket(
+    socket.AF_INET, socket.SOCK_STREAM
+) as s, concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.settimeout(COMMS_TIMEOUT)
+    s.settimeout(ACCEPT_TIMEOUT)
     s.bind((HOST, PORT))
     s.listen()
 
     logger.info(f"SMU server started listening on {HOST}:{PORT}")
 
-    # service client requests
-    while True:
+    # service client requests until one fails
+    while shutdown.is_set() is False:
         try:
             (conn, address) = s.accept()
         except Exception as e:
@@ -388,21 +608,13 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 # non-timeout exceptions for accept() are not cool
                 raise (e)
         else:
-            try:
+            if shutdown.is_set() is True:
+                # don't start new work after a failure
+                conn.close()
+            else:
                 # service request
-                worker(smu, conn)
-            except Exception as e:
-                # build dictionary of smu object attributes that are native types
-                cache = {}
-                for name, value in smu.__dict__.items():
-                    if type(value) in [str, int, float, list, dict, tuple, bool]:
-                        if type(value) is dict:
-                            value = stringify_nonnative_dict_values(value)
-                        cache[name] = value
-
-                # dump attributes to file to read back on relaunch
-                with open(CACHE_PATH, "w") as f:
-                    yaml.dump(cache, f)
-
-                # re-raise the error
-                raise e
+                future = executor.submit(worker, smu, conn)
+                future.add_done_callback(worker_done)
+
+# all workers have finished so re-raise the error that stopped the server
+raise errors[0]
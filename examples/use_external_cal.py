@@ -1,15 +1,16 @@
 """Example using the m1k library to perform voltage sweeps on all connected devices."""
 
-import csv
 import pathlib
 import time
 import sys
 
-import yaml
 import matplotlib.pyplot as plt
+import numpy as np
+import yaml
 
-sys.path.insert(1, str(pathlib.Path.cwd().parent.joinpath("src")))
+sys.path.insert(1, str(pathlib.Path(__file__).resolve().parent.parent.joinpath("src")))
 import m1k.m1k as m1k
+from m1k.yaml_utils import SafeLoader
 
 
 with m1k.smu(plf=50, ch_per_board=2) as smu:
@@ -31,7 +32,7 @@ with m1k.smu(plf=50, ch_per_board=2) as smu:
 
         # load cal data
         with open(cf, "r") as f:
-            data = yaml.load(f, Loader=yaml.SafeLoader)
+            data = yaml.load(f, Loader=SafeLoader)
 
         # add data to cal dict
         if smu.ch_per_board == 1:
@@ -54,16 +55,16 @@ with m1k.smu(plf=50, ch_per_board=2) as smu:
     smu.enable_output(True)
 
     # measure the sweep with internal calibration
-    t0 = time.time()
+    t0 = time.perf_counter()
     data_int = smu.measure(measurement="sweep")
-    print(f"Sweep time with internal calibration: {time.time() - t0} s")
+    print(f"Sweep time with internal calibration: {time.perf_counter() - t0} s")
 
     # measure the sweep with external calibraiton
     smu.use_external_calibration(0, cal_data[0])
     smu.use_external_calibration(1, cal_data[1])
-    t0 = time.time()
+    t0 = time.perf_counter()
     data_ext = smu.measure(measurement="sweep")
-    print(f"Sweep time with external calibration: {time.time() - t0} s")
+    print(f"Sweep time with external calibration: {time.perf_counter() - t0} s")
 
     # disable outputs manually because auto-off is false
     smu.enable_output(False)
@@ -71,12 +72,14 @@ with m1k.smu(plf=50, ch_per_board=2) as smu:
 # plot the i, v data
 fig, ax = plt.subplots()
 
-voltages_int = [v for v, i, t, s in data_int[0]]
-currents_int = [i * 1000 for v, i, t, s in data_int[0]]
+arr_int = np.asarray(data_int[0], dtype=float)
+voltages_int = arr_int[:, 0]
+currents_int = arr_int[:, 1] * 1000
 ax.scatter(voltages_int, currents_int, label=f"channel {0} int")
 
-voltages_ext = [v for v, i, t, s in data_ext[0]]
-currents_ext = [i * 1000 for v, i, t, s in data_ext[0]]
+arr_ext = np.asarray(data_ext[0], dtype=float)
+voltages_ext = arr_ext[:, 0]
+currents_ext = arr_ext[:, 1] * 1000
 ax.scatter(voltages_ext, currents_ext, label=f"channel {0} ext")
 
 ax.axhline(0, lw=0.5, c="black")
@@ -90,11 +93,11 @@ plt.show()
 # plot the R, v data
 fig, ax = plt.subplots()
 
-resistances_int = [v / (i / 1000) for v, i in zip(voltages_int, currents_int)]
+resistances_int = voltages_int / arr_int[:, 1]
 print(f"R@maxV with internal cal = {resistances_int[-1]} Ohms")
 ax.scatter(voltages_int, resistances_int, label=f"channel {0} int")
 
-resistances_ext = [v / (i / 1000) for v, i in zip(voltages_ext, currents_ext)]
+resistances_ext = voltages_ext / arr_ext[:, 1]
 print(f"R@maxV with external cal = {resistances_ext[-1]} Ohms")
 ax.scatter(voltages_ext, resistances_ext, label=f"channel {0} ext")
 
@@ -110,12 +113,7 @@ data_folder = pathlib.Path("data")
 save_file_int = data_folder.joinpath(f"sweep_{int(time.time())}_int.tsv")
 save_file_ext = data_folder.joinpath(f"sweep_{int(time.time())}_ext.tsv")
 
-with open(save_file_int, "w", newline="\n") as f:
-    writer = csv.writer(f, delimiter="\t")
-    for row in data_int[0]:
-        writer.writerow(row)
-
-with open(save_file_ext, "w", newline="\n") as f:
-    writer = csv.writer(f, delimiter="\t")
-    for row in data_ext[0]:
-        writer.writerow(row)
+# tab-separated rows of voltage, current, time, and status
+row_fmt = ["%.6e", "%.6e", "%.6f", "%d"]
+np.savetxt(save_file_int, arr_int, fmt=row_fmt, delimiter="\t")
+np.savetxt(save_file_ext, arr_ext, fmt=row_fmt, delimiter="\t")
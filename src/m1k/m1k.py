@@ -1365,13 +1365,18 @@ class smu:
                     # start indices for each measurement value
                     start_ixs = range(0, len(chunk[dev_ix]), self._samples_per_datum)
 
+                    # convert the device data to an array once so each datum is a
+                    # view, rows are of the form ((A voltage, A current), (B voltage,
+                    # B current))
+                    dev_data = np.asarray(chunk[dev_ix], dtype=float).reshape(-1, 2, 2)
+
                     A_voltages = []
                     B_voltages = []
                     currents = []
                     timestamps = []
                     for i in start_ixs:
                         # final point can overlap with start of next voltage so cut it
-                        data_slice = chunk[dev_ix][i : i + self._samples_per_datum - 1]
+                        data_slice = dev_data[i : i + self._samples_per_datum - 1]
                         # discard settling delay data
                         data_slice = data_slice[self._settling_delay_samples :]
 
@@ -1389,28 +1394,26 @@ class smu:
                             timestamps.append("nan")
 
                         # pick out and process useful data
-                        A_point_voltages = []
-                        B_point_voltages = []
-                        point_currents = []
-                        for row in data_slice:
-                            A_point_voltages.append(row[0][0])
-                            B_point_voltages.append(row[1][0])
-                            point_currents.append(row[0][1])
+                        A_point_voltages = data_slice[:, 0, 0]
+                        B_point_voltages = data_slice[:, 1, 0]
+                        point_currents = data_slice[:, 0, 1]
 
                         # filter spikes
                         thresh = 0.01
                         diffs = np.gradient(point_currents)
-                        pc = np.array(point_currents)
                         keep_i = np.abs(diffs) < thresh
                         to_keep = np.roll(keep_i, 1)
 
-                        point_currents = pc[to_keep].tolist()
-                        A_point_voltages = np.array(A_point_voltages)[to_keep].tolist()
-                        B_point_voltages = np.array(B_point_voltages)[to_keep].tolist()
+                        point_currents = point_currents[to_keep]
+                        A_point_voltages = A_point_voltages[to_keep]
+                        B_point_voltages = B_point_voltages[to_keep]
 
-                        A_voltages.append(sum(A_point_voltages) / len(A_point_voltages))
-                        B_voltages.append(sum(B_point_voltages) / len(B_point_voltages))
-                        currents.append(sum(point_currents) / len(point_currents))
+                        # sum in numpy but divide as floats so an empty slice still
+                        # raises the ZeroDivisionError handled by `measure()`
+                        n = len(point_currents)
+                        A_voltages.append(float(A_point_voltages.sum()) / n)
+                        B_voltages.append(float(B_point_voltages.sum()) / n)
+                        currents.append(float(point_currents.sum()) / n)
 
                     # update measured values according to external calibration
                     if self._channel_settings[ch]["calibration_mode"] == "external":
@@ -1474,6 +1477,11 @@ class smu:
                     # start indices for each measurement value
                     start_ixs = range(0, len(chunk[dev_ix]), self._samples_per_datum)
 
+                    # convert the device data to an array once so each datum is a
+                    # view, rows are of the form ((A voltage, A current), (B voltage,
+                    # B current))
+                    dev_data = np.asarray(chunk[dev_ix], dtype=float).reshape(-1, 2, 2)
+
                     if dev_channel == "A":
                         dev_channel_num = 0
                     else:
@@ -1484,7 +1492,7 @@ class smu:
                     timestamps = []
                     for i in start_ixs:
                         # final point can overlap with start of next voltage so cut it
-                        data_slice = chunk[dev_ix][i : i + self._samples_per_datum - 1]
+                        data_slice = dev_data[i : i + self._samples_per_datum - 1]
                         # discard settling delay data
                         data_slice = data_slice[self._settling_delay_samples :]
 
@@ -1502,24 +1510,23 @@ class smu:
                             timestamps.append("nan")
 
                         # pick out and process useful data
-                        point_voltages = []
-                        point_currents = []
-                        for row in data_slice:
-                            point_voltages.append(row[dev_channel_num][0])
-                            point_currents.append(row[dev_channel_num][1])
+                        point_voltages = data_slice[:, dev_channel_num, 0]
+                        point_currents = data_slice[:, dev_channel_num, 1]
 
                         # filter spikes
                         thresh = 0.01
                         diffs = np.gradient(point_currents)
-                        pc = np.array(point_currents)
                         keep_i = np.abs(diffs) < thresh
                         to_keep = np.roll(keep_i, 1)
 
-                        point_currents = pc[to_keep].tolist()
-                        point_voltages = np.array(point_voltages)[to_keep].tolist()
+                        point_currents = point_currents[to_keep]
+                        point_voltages = point_voltages[to_keep]
 
-                        voltages.append(sum(point_voltages) / len(point_voltages))
-                        currents.append(sum(point_currents) / len(point_currents))
+                        # sum in numpy but divide as floats so an empty slice still
+                        # raises the ZeroDivisionError handled by `measure()`
+                        n = len(point_currents)
+                        voltages.append(float(point_voltages.sum()) / n)
+                        currents.append(float(point_currents.sum()) / n)
 
                     # update measured values according to external calibration
                     cal_mode = self._channel_settings[ch]["calibration_mode"]
@@ -1821,6 +1828,8 @@ class smu:
         else:
             channels = [channel]
 
-        for ch in channels:
-            dev_ix = self._channel_settings[ch]["dev_ix"]
+        # LEDs are per device so only send one control transfer to each board, even
+        # if more than one of its channels is given
+        dev_ixs = {self._channel_settings[ch]["dev_ix"] for ch in channels}
+        for dev_ix in sorted(dev_ixs):
             self._session.devices[dev_ix].set_led(setting)
@@ -0,0 +1,12 @@
+"""YAML loader and dumper for the example scripts.
+
+PyYAML isn't a dependency of the m1k package so this module is not imported by
+`m1k` itself.
+"""
+
+# use libyaml's C loader and dumper if pyyaml was built with it, they're much faster
+# than the pure python versions
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper